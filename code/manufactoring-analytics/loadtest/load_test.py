@@ -0,0 +1,328 @@
+"""
+Load test for the analytics API in microservice_scheduler.py.
+
+Starts the Flask app in-process against an in-memory (mongomock) database
+seeded with generated orders and machines, then hits each endpoint at the
+requested concurrency and reports throughput and p50/p95/p99 latency as JSON.
+Latency percentiles cover successful (2xx) responses; each status code also
+gets its own. `run` is hit by one client at a time: concurrent runs of a plant
+are rejected with 409, which would otherwise swamp the timing of real runs.
+
+Two scenarios are measured:
+  - idle:        no analytics run in progress
+  - during_run:  analytics runs back-to-back, writing to OUTPUT_DIR meanwhile
+
+Usage (from code/manufactoring-analytics):
+    python loadtest/load_test.py --orders 2000 --concurrency 8 --duration 10 \
+        --output loadtest_results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+MACHINES = ["Taglio", "Piega 1", "Piega 2", "Saldatura", "Assemblaggio", "Filettatura", "Verniciatura"]
+OPERATORS = ["Operatore", "michael Luca", "Anna Rossi", "Marco Bianchi"]
+FAMILIES = ["intervento semplice carrozzeria esterna SUV", "Hourglass", "Kit ricambi", "Telaio"]
+
+# name -> (method, path, headers)
+ENDPOINTS = {
+    "health": ("GET", "/health", {}),
+    "summary": ("GET", "/analytics/summary", {}),
+    "files": ("GET", "/analytics/files", {}),
+    "download": ("GET", "/analytics/download/phase_metrics.csv", {}),
+    "download_gzip": ("GET", "/analytics/download/phase_metrics.csv", {"Accept-Encoding": "gzip"}),
+    "download_slice": ("GET", "/analytics/download/order_timeline.csv?rows=0-100", {}),
+    "run": ("POST", "/analytics/run", {}),
+}
+# Endpoints timed with a single client, whatever --concurrency says
+SEQUENTIAL_ENDPOINTS = {"run"}
+
+
+def generate_orders(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Orders shaped like `newOrdini` documents (native types, as pymongo returns them)."""
+    rnd = random.Random(seed)
+    base = datetime(2025, 1, 1)
+    orders = []
+    for i in range(count):
+        insert_date = base + timedelta(minutes=rnd.randint(0, 60 * 24 * 365))
+        status = rnd.choice([1, 2, 3, 4, 4, 4])
+        cursor = insert_date
+        phases = []
+        for machine in rnd.sample(MACHINES, rnd.randint(1, 5)):
+            queue_insert = cursor + timedelta(hours=rnd.randint(0, 48))
+            queue_real_insert = queue_insert + timedelta(hours=rnd.randint(-4, 72))
+            finish = queue_real_insert + timedelta(hours=rnd.randint(1, 24))
+            phase = {
+                "phaseId": str(uuid.UUID(int=rnd.getrandbits(128))),
+                "phaseName": machine,
+                "phaseStatus": status,
+                "cycleTime": rnd.randint(10, 200),
+                "phaseRealTime": 0,
+                "declaredQuantity": rnd.randint(0, 20),
+                "operators": rnd.sample(OPERATORS, rnd.randint(0, 2)),
+                "queueInsertDate": queue_insert,
+                "queueRealInsertDate": queue_real_insert,
+                "finishDate": finish,
+            }
+            if status == 4:
+                phase["realFinishDate"] = finish + timedelta(hours=rnd.randint(-2, 12))
+            phases.append(phase)
+            cursor = finish
+
+        order = {
+            "orderId": f"LT{i:07d}",
+            "codiceArticolo": f"{rnd.randint(1, 50):04d}",
+            "famigliaDiProdotto": rnd.choice(FAMILIES),
+            "quantity": rnd.randint(1, 20),
+            "priority": rnd.randint(0, 2),
+            "orderStatus": status,
+            "orderInsertDate": insert_date,
+            "orderStartDate": insert_date,
+            "orderDeadline": insert_date + timedelta(days=rnd.randint(3, 40)),
+            "Phases": phases,
+        }
+        if status == 4:
+            order["realOrderFinishDate"] = cursor + timedelta(days=rnd.randint(0, 5))
+        orders.append(order)
+    return orders
+
+
+def generate_machines() -> List[Dict[str, Any]]:
+    return [
+        {"name": name, "macchinarioActive": True, "queueTargetTime": 1310, "tablet": list(range(i))}
+        for i, name in enumerate(MACHINES)
+    ]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def latency_stats(latencies: List[float]) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+        "max": latencies[-1] if latencies else None,
+    }
+
+
+def hit_endpoint(base_url: str, endpoint: str, concurrency: int, duration: float) -> Dict[str, Any]:
+    """Hit one endpoint from `concurrency` workers for `duration` seconds."""
+    method, path, headers = ENDPOINTS[endpoint]
+    if endpoint in SEQUENTIAL_ENDPOINTS:
+        concurrency = 1
+    # status code -> latencies (ms)
+    latencies: Dict[str, List[float]] = {}
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            request = urllib.request.Request(base_url + path, method=method, headers=headers)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=300) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                e.read()
+                status = e.code
+            except Exception:
+                status = None
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if status is None:
+                    errors += 1
+                    continue
+                latencies.setdefault(str(status), []).append(elapsed)
+
+    started = time.monotonic()
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    requests = sum(len(values) for values in latencies.values())
+    successful = [
+        value for status, values in latencies.items() if status.startswith("2") for value in values
+    ]
+    return {
+        "method": method,
+        "path": path,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "status_codes": {status: len(values) for status, values in sorted(latencies.items())},
+        "throughput_rps": round(requests / elapsed, 2) if elapsed > 0 else None,
+        # Successful responses only; rejections (e.g. 409) are in latency_ms_by_status
+        "latency_ms": latency_stats(successful),
+        "latency_ms_by_status": {
+            status: latency_stats(values) for status, values in sorted(latencies.items())
+        },
+    }
+
+
+@contextlib.contextmanager
+def runs_in_progress(scheduler, plant):
+    """Keep analytics runs going back-to-back until the block exits."""
+    stop = threading.Event()
+    runs = {"completed": 0}
+
+    def loop():
+        while not stop.is_set():
+            with contextlib.redirect_stdout(io.StringIO()):
+                scheduler.run_analytics(plant, resume=False)
+            runs["completed"] += 1
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    # Let the first run get going before measuring
+    while plant.last_run_status["status"] != "running":
+        time.sleep(0.01)
+    try:
+        yield runs
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_load_test(args, endpoints: List[str], scenarios: List[str], output_dir: str) -> Dict[str, Any]:
+    """Seed the database, start the API and measure every scenario; returns the report."""
+    os.environ.update({
+        "USE_MOCK_MONGO": "true",
+        "MONGO_URI": "mongodb://loadtest/",
+        "OUTPUT_DIR": output_dir,
+        "GRAFANA_CSV_DIR": os.path.join(output_dir, "no-grafana"),
+        "RUN_TIME_BUDGET_MINUTES": "0",
+    })
+    os.environ.pop("PLANTS_CONFIG", None)
+    sys.path.insert(0, SRC_DIR)
+
+    import microservice_scheduler as scheduler
+    from werkzeug.serving import make_server
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    plant = scheduler.plants[scheduler.DEFAULT_PLANT_ID]
+    scheduler.initialize_analytics(plant)
+    print(f"Seeding {args.orders} orders...", file=sys.stderr)
+    plant.analytics.orders_collection.insert_many(generate_orders(args.orders, args.seed))
+    plant.analytics.machines_collection.insert_many(generate_machines())
+
+    print("Running initial analytics...", file=sys.stderr)
+    run_started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduler.run_analytics(plant)
+    run_seconds = time.perf_counter() - run_started
+
+    server = make_server("127.0.0.1", 0, scheduler.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    report: Dict[str, Any] = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {
+            "orders": args.orders,
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "endpoints": endpoints,
+        },
+        "analytics_run_seconds": round(run_seconds, 3),
+        "scenarios": {},
+    }
+
+    try:
+        for scenario in scenarios:
+            results = {}
+            context = (
+                runs_in_progress(scheduler, plant)
+                if scenario == "during_run"
+                else contextlib.nullcontext({"completed": 0})
+            )
+            with context as runs:
+                for endpoint in endpoints:
+                    print(f"[{scenario}] {endpoint}...", file=sys.stderr)
+                    results[endpoint] = hit_endpoint(base_url, endpoint, args.concurrency, args.duration)
+            report["scenarios"][scenario] = {
+                "background_runs_completed": runs["completed"],
+                "endpoints": results,
+            }
+    finally:
+        server.shutdown()
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000, help="generated orders (default: 2000)")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients per endpoint (default: 8)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per endpoint and scenario (default: 10)")
+    parser.add_argument(
+        "--endpoints",
+        default=",".join(ENDPOINTS),
+        help=f"comma-separated subset of: {', '.join(ENDPOINTS)}",
+    )
+    parser.add_argument("--scenarios", default="idle,during_run", help="comma-separated subset of: idle, during_run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="loadtest_results.json", help="JSON report path")
+    args = parser.parse_args()
+
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {unknown}")
+    scenarios = [s for s in args.scenarios.split(",") if s]
+
+    # Outputs of the runs go to a temporary directory, removed afterwards
+    with tempfile.TemporaryDirectory(prefix="analytics_loadtest_") as output_dir:
+        report = run_load_test(args, endpoints, scenarios, output_dir)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    def ms(value):
+        return f"{value:>8.1f} ms" if value is not None else f"{'-':>8}   "
+
+    # Latencies of successful responses; "-" when every request was rejected
+    for scenario, data in report["scenarios"].items():
+        for endpoint, result in data["endpoints"].items():
+            latency = result["latency_ms"]
+            print(
+                f"{scenario:<11} {endpoint:<15} {result['throughput_rps'] or 0:>9.1f} req/s  "
+                f"p50 {ms(latency['p50'])}  p95 {ms(latency['p95'])}  "
+                f"p99 {ms(latency['p99'])}  {result['status_codes']}"
+            )
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Bulk decoding of MongoDB Extended JSON / native values into typed columns.
+
+Documents may hold numbers and dates either as native values (as pymongo
+returns them) or as Extended JSON wrappers such as {"$numberInt": "5"} or
+{"$date": {"$numberLong": "1742225725415"}}. Instead of parsing field by
+field, each function here takes a whole column of such values, unwraps it in
+a single comprehension and converts it with one vectorized pandas/NumPy call.
+
+Dates are decoded to UTC (naive datetimes are taken as UTC, which is what
+pymongo returns) and only converted to a display timezone explicitly, with
+`to_timezone`.
+"""
+from typing import Any, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+# Value kinds, routed to the converter that handles them fastest
+_MISSING, _NUMBER, _TEXT, _OTHER = range(4)
+
+# Largest magnitude below which every integer is exact in float64
+_FLOAT_EXACT_LIMIT = 2 ** 53
+# Magnitude from which a float no longer fits in int64
+_INT64_LIMIT = 2.0 ** 63
+
+
+class _KindsByType(dict):
+    """type -> value kind; types not listed (bson Int64, NumPy scalars,
+    datetimes, ...) are classified on first sight and cached"""
+
+    def __missing__(self, cls):
+        if issubclass(cls, (bool, np.bool_)):
+            kind = _MISSING
+        elif issubclass(cls, (int, float, np.integer, np.floating)):
+            kind = _NUMBER
+        else:
+            kind = _OTHER
+        self[cls] = kind
+        return kind
+
+
+# Booleans are never dates: a stray True/False is treated as missing
+_KINDS = _KindsByType({type(None): _MISSING, int: _NUMBER, float: _NUMBER, bool: _MISSING, str: _TEXT})
+
+
+def _to_float(values: Sequence[Any]) -> np.ndarray:
+    """Numbers / numeric strings / None -> float64, NaN where not numeric."""
+    try:
+        # NumPy parses numeric strings itself and is much faster than pandas
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(
+            dtype="float64"
+        )
+
+
+def decode_ints(values: Sequence[Any], default: int = 0) -> np.ndarray:
+    """
+    Decode a column of {"$numberInt"/"$numberLong"/"$numberDouble": "..."},
+    ints, floats or numeric strings into an `int64` array. Missing or
+    unparseable values become `default`; fractional values are truncated.
+    Integers beyond 2**53 are parsed exactly, not through float64.
+    """
+    # Extended JSON number wrappers hold a single key
+    raw = [next(iter(v.values()), None) if type(v) is dict else v for v in values]
+    numbers = _to_float(raw)
+    numbers[np.isnan(numbers)] = default
+    with np.errstate(invalid="ignore"):
+        ints = numbers.astype(np.int64)
+    # Beyond 2**53 float64 drops digits: re-parse those (rare) values exactly,
+    # keeping the float value for e.g. "1.5e16"; beyond int64 they become `default`
+    for i in np.flatnonzero(np.abs(numbers) >= _FLOAT_EXACT_LIMIT):
+        try:
+            ints[i] = int(raw[i])
+        except (TypeError, ValueError, OverflowError):
+            if not abs(numbers[i]) < _INT64_LIMIT:
+                ints[i] = default
+    return ints
+
+
+def decode_dates(values: Sequence[Any]) -> pd.Series:
+    """
+    Decode a column of {"$date": {"$numberLong": ms}}, {"$date": ms | iso},
+    datetimes, epoch milliseconds or ISO strings into a `datetime64[ms, UTC]`
+    Series. Missing or unparseable values become NaT, and so do booleans,
+    epoch 0 (the "no date" sentinel, which was always read as missing) and
+    milliseconds outside the int64 range.
+    """
+    raw = [v.get("$date") if type(v) is dict else v for v in values]
+    raw = [v.get("$numberLong") if type(v) is dict else v for v in raw]
+    raw = np.fromiter(raw, dtype=object, count=len(raw))
+    kinds = np.fromiter((_KINDS[type(v)] for v in raw), dtype=np.int8, count=len(raw))
+
+    decoded = np.full(len(raw), np.datetime64("NaT"), dtype="datetime64[ms]")
+
+    # Epoch milliseconds, as numbers or numeric strings; other strings are ISO dates
+    numeric = (kinds == _NUMBER) | (kinds == _TEXT)
+    millis = np.full(len(raw), np.nan)
+    if numeric.any():
+        millis[numeric] = _to_float(raw[numeric].tolist())
+    is_millis = ~np.isnan(millis)
+    # NaN compares False, so this also leaves out non-numeric strings
+    valid = (np.abs(millis) < _INT64_LIMIT) & (millis != 0)
+    decoded[valid] = millis[valid].astype(np.int64).astype("datetime64[ms]")
+
+    iso = (kinds == _TEXT) & ~is_millis
+    if iso.any():
+        parsed = pd.to_datetime(raw[iso], utc=True, format="ISO8601", errors="coerce")
+        decoded[iso] = parsed.tz_localize(None).to_numpy().astype("datetime64[ms]")
+
+    # datetime objects (naive ones are UTC, as pymongo returns them)
+    other = kinds == _OTHER
+    if other.any():
+        parsed = pd.to_datetime(raw[other], utc=True, errors="coerce")
+        decoded[other] = parsed.tz_localize(None).to_numpy().astype("datetime64[ms]")
+
+    return pd.Series(decoded, dtype="datetime64[ms]").dt.tz_localize("UTC")
+
+
+def to_timezone(dates: pd.Series, timezone: str) -> pd.Series:
+    """Convert UTC dates to naive wall-clock time in `timezone` for reporting."""
+    return dates.dt.tz_convert(timezone).dt.tz_localize(None)
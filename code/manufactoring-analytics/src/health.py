@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class MongoPingCache:
+    """
+    Cached MongoDB reachability, so health probes never wait on the database.
+
+    `status(client)` returns the last ping result for that client and, once it
+    is older than `ttl` seconds, starts one background re-ping; concurrent
+    probes keep reading the previous result meanwhile. Before the first ping
+    completes the status is "unknown".
+    """
+
+    def __init__(self, ttl: float = 15.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # id(client) -> {"status", "checked_at", "latency_ms", "refreshing"}
+        self._results: Dict[int, Dict[str, Any]] = {}
+
+    def status(self, client) -> Dict[str, Any]:
+        key = id(client)
+        with self._lock:
+            result = self._results.setdefault(
+                key,
+                {"status": "unknown", "checked_at": None, "latency_ms": None, "refreshing": False},
+            )
+            stale = result["checked_at"] is None or time.monotonic() - result["checked_at"] > self.ttl
+            if stale and not result["refreshing"]:
+                result["refreshing"] = True
+                threading.Thread(target=self._ping, args=(client, key), daemon=True).start()
+            return {
+                "status": result["status"],
+                "latency_ms": result["latency_ms"],
+                "age_seconds": round(time.monotonic() - result["checked_at"], 1)
+                if result["checked_at"] is not None
+                else None,
+            }
+
+    def _ping(self, client, key: int):
+        started = time.monotonic()
+        try:
+            client.admin.command("ping")
+            status = "connected"
+        except Exception as e:
+            logger.warning(f"MongoDB ping failed: {str(e)}")
+            status = f"error: {str(e)}"
+        with self._lock:
+            self._results[key].update(
+                {
+                    "status": status,
+                    "checked_at": time.monotonic(),
+                    "latency_ms": round((time.monotonic() - started) * 1000, 1),
+                    "refreshing": False,
+                }
+            )
+
+
+class StartupTimer:
+    """Records how long the service took to first report ready."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.ready_after: Optional[float] = None
+
+    def mark_ready(self):
+        if self.ready_after is None:
+            self.ready_after = time.monotonic() - self.started_at
+            logger.info(f"Service ready {self.ready_after:.2f}s after start")
@@ -0,0 +1,633 @@
+import json
+import logging
+import math
+import queue
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pymongo.errors import PyMongoError
+
+from data_quality import ORDER_RULES, PHASE_RULES, validate
+from manufacturing_analytics import ManufacturingAnalytics
+
+
+logger = logging.getLogger(__name__)
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+EPOCH = pd.Timestamp(0, tz="UTC")
+
+# Per (order, machine) share of the phase totals; times are in milliseconds
+# (whole numbers, so adding and subtracting shares stays exact)
+SHARE_SUMS = [
+    "phases",
+    "jobs",
+    "completed",
+    "in_progress",
+    "finished",
+    "cycle_sum",
+    "quantity_sum",
+    "duration_sum",
+    "duration_count",
+    "queue_delay_sum",
+    "queue_delay_sq_sum",
+    "queue_delay_count",
+    "finish_delay_sum",
+    "finish_delay_count",
+]
+# Extremes, with the function that merges two of them
+SHARE_EXTREMES = {"first_start": min, "last_finish": max, "max_queue_delay": max}
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Convert a DataFrame to JSON-safe records (NaN/NaT -> None, ISO dates)."""
+    if df.empty:
+        return []
+    return json.loads(df.to_json(orient="records", date_format="iso", double_precision=15))
+
+
+def _merge_extreme(pick, current: Optional[float], value: Optional[float]) -> Optional[float]:
+    if current is None:
+        return value
+    if value is None:
+        return current
+    return pick(current, value)
+
+
+def _phase_shares(phase_df: pd.DataFrame) -> Dict[Tuple[Any, str], Dict[str, Any]]:
+    """
+    Total the phase metrics per (order _id, machine): the unit the machine
+    aggregates are updated by. `phase_df` carries the order's _id in `_doc`.
+    """
+    if phase_df.empty:
+        return {}
+
+    def millis(delta: pd.Series) -> pd.Series:
+        return delta.dt.total_seconds() * 1000  # NaN where a date is missing
+
+    duration = millis(phase_df["real_finish_date"] - phase_df["queue_real_insert_date"])
+    queue_delay = millis(phase_df["queue_real_insert_date"] - phase_df["queue_insert_date"])
+    finish_delay = millis(phase_df["real_finish_date"] - phase_df["planned_finish_date"])
+    status = phase_df["phase_status"]
+
+    parts = pd.DataFrame(
+        {
+            "doc": phase_df["_doc"],
+            "machine": phase_df["phase_name"],
+            "phases": 1,
+            "jobs": phase_df["phase_id"].notna().astype(int),
+            "completed": (status == 4).astype(int),
+            "in_progress": status.isin([1, 2, 3]).astype(int),
+            "finished": phase_df["real_finish_date"].notna().astype(int),
+            "cycle_sum": phase_df["cycle_time"],
+            "quantity_sum": phase_df["declared_quantity"],
+            "duration_sum": duration.fillna(0),
+            "duration_count": duration.notna().astype(int),
+            "queue_delay_sum": queue_delay.fillna(0),
+            # In hours², like the std it feeds; not exact, but only shown rounded
+            "queue_delay_sq_sum": (queue_delay / HOUR_MS).pow(2).fillna(0),
+            "queue_delay_count": queue_delay.notna().astype(int),
+            "finish_delay_sum": finish_delay.fillna(0),
+            "finish_delay_count": finish_delay.notna().astype(int),
+            "first_start": millis(phase_df["queue_real_insert_date"] - EPOCH),
+            "last_finish": millis(phase_df["real_finish_date"] - EPOCH),
+            "max_queue_delay": queue_delay,
+        }
+    )
+    aggregations = dict.fromkeys(SHARE_SUMS, "sum")
+    aggregations.update({field: pick.__name__ for field, pick in SHARE_EXTREMES.items()})
+    grouped = parts.groupby(["doc", "machine"], sort=False).agg(aggregations)
+
+    shares = {}
+    for key, values in zip(grouped.index, grouped.to_dict("records")):
+        for field in SHARE_EXTREMES:
+            if pd.isna(values[field]):
+                values[field] = None
+        values["operators"] = Counter()
+        shares[key] = values
+
+    # Same operator tokens as calculate_machine_metrics: each phase's names, split on ","
+    for key, operators in zip(
+        zip(phase_df["_doc"], phase_df["phase_name"]), phase_df["operators"].fillna("")
+    ):
+        if key in shares:
+            shares[key]["operators"].update(operators.split(","))
+    return shares
+
+
+class _MachineAggregate:
+    """
+    Running totals of one machine's phases, kept per order: a change only
+    subtracts the order's old share and adds its new one. Extremes are
+    recomputed from the shares only when a removed share held one of them.
+    """
+
+    def __init__(self):
+        self.shares: Dict[Any, Dict[str, Any]] = {}
+        self.totals: Dict[str, float] = dict.fromkeys(SHARE_SUMS, 0)
+        self.operators: Counter = Counter()
+        self._extremes: Optional[Dict[str, Optional[float]]] = dict.fromkeys(SHARE_EXTREMES)
+
+    def add(self, doc_id: Any, share: Dict[str, Any]):
+        self.shares[doc_id] = share
+        for field in SHARE_SUMS:
+            self.totals[field] += share[field]
+        self.operators.update(share["operators"])
+        if self._extremes is not None:
+            for field, pick in SHARE_EXTREMES.items():
+                self._extremes[field] = _merge_extreme(pick, self._extremes[field], share[field])
+
+    def remove(self, doc_id: Any):
+        share = self.shares.pop(doc_id, None)
+        if share is None:
+            return
+        for field in SHARE_SUMS:
+            self.totals[field] -= share[field]
+        for operator, count in share["operators"].items():
+            self.operators[operator] -= count
+            if self.operators[operator] <= 0:
+                del self.operators[operator]
+        if self._extremes is not None and any(
+            share[field] is not None and share[field] == self._extremes[field]
+            for field in SHARE_EXTREMES
+        ):
+            self._extremes = None
+
+    def extremes(self) -> Dict[str, Optional[float]]:
+        if self._extremes is None:
+            self._extremes = dict.fromkeys(SHARE_EXTREMES)
+            for share in self.shares.values():
+                for field, pick in SHARE_EXTREMES.items():
+                    self._extremes[field] = _merge_extreme(pick, self._extremes[field], share[field])
+        return self._extremes
+
+
+class LiveKPIMonitor:
+    """
+    Keep machine, queue and order KPIs up to date as `newOrdini` and
+    `macchinari` change, and fan out compact deltas to subscribers.
+
+    Changes are read from MongoDB change streams. Where those are not
+    available (standalone server, mongomock) the collections are polled every
+    `poll_interval` seconds and diffed against the previous snapshot instead.
+    Streams are opened (or the poll baseline taken) before the initial state
+    is loaded, so no change made meanwhile is missed.
+
+    The initial state is computed in one bulk pass. On each change only the
+    rows it touches are recomputed: the changed order's timeline row, and the
+    machine/queue rows of the machines its phases ran on, from per-machine
+    running totals (`_MachineAggregate`). Global KPIs are kept as running
+    totals too.
+    """
+
+    def __init__(self, analytics: ManufacturingAnalytics, poll_interval: float = 5.0):
+        self.analytics = analytics
+        self.poll_interval = poll_interval
+
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._subscribers: List[queue.Queue] = []
+        self._reset_state()
+
+    def _reset_state(self):
+        # Orders, keyed by MongoDB _id (deletions only carry the _id)
+        self._order_ids: Dict[Any, str] = {}
+        self._timeline_rows: Dict[Any, Dict[str, Any]] = {}
+        # Phase totals per machine name; machines each order's phases ran on
+        self._machine_aggregates: Dict[str, _MachineAggregate] = {}
+        self._order_machines: Dict[Any, set] = {}
+
+        # Machines, keyed by MongoDB _id and by name
+        self._machine_names: Dict[Any, str] = {}
+        self._machines: Dict[str, Dict] = {}
+        self._machine_rows: Dict[str, Dict[str, Any]] = {}
+        self._queue_rows: Dict[str, Dict[str, Any]] = {}
+
+        self._totals = {
+            "total_orders": 0,
+            "completed_orders": 0,
+            "on_time_known": 0,
+            "on_time_orders": 0,
+            "lead_time_count": 0,
+            "lead_time_sum": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Lifecycle & subscriptions
+    # ------------------------------------------------------------------
+    def start(self):
+        """Start watching both collections, then load their current state."""
+        if self._threads:
+            return
+
+        watched = [
+            (self.analytics.orders_collection, self._on_order_change),
+            (self.analytics.machines_collection, self._on_machine_change),
+        ]
+        # Open the change streams first: changes made while the snapshot loads
+        # are then replayed (applying a full document again is harmless)
+        streams = [self._open_stream(collection) for collection, _ in watched]
+        orders = list(self.analytics.orders_collection.find())
+        machines = list(self.analytics.machines_collection.find())
+
+        with self._lock:
+            try:
+                self._load(orders, machines)
+            except Exception as e:
+                logger.error(
+                    f"Bulk load of live KPIs failed ({type(e).__name__}: {str(e)}); "
+                    "loading document by document"
+                )
+                self._reset_state()
+                for machine in machines:
+                    self._handle(self.analytics.machines_collection, self._apply_machine, machine["_id"], machine)
+                for order in orders:
+                    self._handle(self.analytics.orders_collection, self._apply_order, order["_id"], order)
+
+        # Without a stream, the loaded documents are the poll baseline
+        for (collection, handler), stream, documents in zip(watched, streams, (orders, machines)):
+            thread = threading.Thread(
+                target=self._watch, args=(collection, handler, stream, documents), daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Live KPI monitor started with {len(orders)} orders and {len(machines)} machines")
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=self.poll_interval + 1)
+        self._threads = []
+
+    @property
+    def running(self) -> bool:
+        """True while both watch threads are alive (a dead one means a restart is needed)."""
+        return (
+            bool(self._threads)
+            and all(thread.is_alive() for thread in self._threads)
+            and not self._stop.is_set()
+        )
+
+    def subscribe(self, max_pending: int = 100) -> queue.Queue:
+        """Register a subscriber; deltas are put on the returned queue."""
+        subscriber: queue.Queue = queue.Queue(maxsize=max_pending)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current machine and queue rows plus global KPIs (no order rows)."""
+        with self._lock:
+            return {
+                "timestamp": datetime.now().isoformat(),
+                "machines": list(self._machine_rows.values()),
+                "queues": list(self._queue_rows.values()),
+                "kpis": self._kpis(),
+            }
+
+    def _publish(self, delta: Dict[str, Any]):
+        delta["timestamp"] = datetime.now().isoformat()
+        delta["kpis"] = self._kpis()
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.put_nowait(delta)
+            except queue.Full:
+                logger.warning("Dropping live KPI delta for a slow subscriber")
+
+    # ------------------------------------------------------------------
+    # Change detection
+    # ------------------------------------------------------------------
+    def _open_stream(self, collection):
+        """Open a collection's change stream, or return None where unsupported."""
+        try:
+            return collection.watch(full_document="updateLookup", max_await_time_ms=1000)
+        except (PyMongoError, TypeError, NotImplementedError) as e:
+            # mongomock has no watch(); standalone servers reject $changeStream
+            logger.info(f"Change streams unavailable on {collection.name} ({e}); polling instead")
+            return None
+
+    def _watch(self, collection, handler, stream, documents: Optional[List[Dict]]):
+        """Follow a collection's change stream, or poll it from `documents`."""
+        if stream is not None:
+            try:
+                with stream:
+                    logger.info(f"Watching change stream on {collection.name}")
+                    while not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        document = None if change["operationType"] == "delete" else change.get("fullDocument")
+                        self._handle(collection, handler, change["documentKey"]["_id"], document)
+                return
+            except PyMongoError as e:
+                logger.warning(f"Change stream on {collection.name} failed ({e}); polling instead")
+                documents = None
+        self._poll(collection, handler, documents)
+
+    def _poll(self, collection, handler, documents: Optional[List[Dict]] = None):
+        if documents is None:
+            documents = collection.find()
+        previous = {doc["_id"]: doc for doc in documents}
+        while not self._stop.wait(self.poll_interval):
+            try:
+                current = {doc["_id"]: doc for doc in collection.find()}
+            except PyMongoError as e:
+                logger.error(f"Error polling {collection.name}: {str(e)}")
+                continue
+            for doc_id, doc in current.items():
+                if previous.get(doc_id) != doc:
+                    self._handle(collection, handler, doc_id, doc)
+            for doc_id in previous.keys() - current.keys():
+                self._handle(collection, handler, doc_id, None)
+            previous = current
+
+    def _handle(self, collection, handler, doc_id: Any, document: Optional[Dict]):
+        """Apply one change; a document that cannot be processed is logged and
+        skipped instead of killing the watch thread."""
+        try:
+            handler(doc_id, document)
+        except Exception as e:
+            logger.error(f"Skipping {collection.name} document {doc_id}: {type(e).__name__}: {str(e)}")
+
+    def _on_order_change(self, doc_id: Any, order: Optional[Dict]):
+        with self._lock:
+            delta = self._apply_order(doc_id, order)
+            self._publish(delta)
+
+    def _on_machine_change(self, doc_id: Any, machine: Optional[Dict]):
+        with self._lock:
+            delta = self._apply_machine(doc_id, machine)
+            self._publish(delta)
+
+    # ------------------------------------------------------------------
+    # Initial load & incremental recomputation
+    # ------------------------------------------------------------------
+    def _decode(
+        self, orders: List[Dict], doc_ids: List[Any]
+    ) -> Tuple[Dict[Any, Dict[str, Any]], Dict[Tuple[Any, str], Dict[str, Any]], pd.DataFrame]:
+        """
+        Decode `orders` in bulk into timeline rows per order _id, phase shares
+        per (order _id, machine) and the phase metrics table. Rows failing a
+        data-quality rule are kept out of the live KPIs, as out of the reports.
+        """
+        decoded_orders, decoded_phases = self.analytics.decode_orders(orders)
+        doc_array = np.empty(len(doc_ids), dtype=object)
+        doc_array[:] = doc_ids
+        decoded_orders["_doc"] = doc_array
+        # Phases are flattened in order, as decode_orders does
+        decoded_phases["_doc"] = np.repeat(
+            doc_array, [len(order.get("Phases") or []) for order in orders]
+        )
+
+        valid_orders, _, _ = validate(decoded_orders, ORDER_RULES)
+        valid_phases, _, _ = validate(decoded_phases, PHASE_RULES)
+        timeline = self.analytics.build_order_timeline(valid_orders.drop(columns="_doc"))
+        rows = dict(zip(valid_orders["_doc"], _records(self.analytics.localize_dates(timeline))))
+        phase_df = self.analytics.build_phase_metrics(valid_phases)
+        return rows, _phase_shares(phase_df), phase_df
+
+    def _load(self, orders: List[Dict], machines: List[Dict]):
+        """Build the whole state in one pass, with the batch report functions."""
+        for machine in machines:
+            name = machine.get("name", "")
+            self._machine_names[machine["_id"]] = name
+            self._machines[name] = machine
+
+        doc_ids = [order["_id"] for order in orders]
+        rows, shares, phase_df = self._decode(orders, doc_ids)
+        for order in orders:
+            self._order_ids[order["_id"]] = order.get("orderId", "")
+        for doc_id, row in rows.items():
+            self._timeline_rows[doc_id] = row
+            self._count_order(row, 1)
+        for (doc_id, machine_name), share in shares.items():
+            self._machine_aggregates.setdefault(machine_name, _MachineAggregate()).add(doc_id, share)
+            self._order_machines.setdefault(doc_id, set()).add(machine_name)
+
+        machine_metrics = self.analytics.calculate_machine_metrics(
+            phase_df, list(self._machines.values())
+        )
+        self._machine_rows = {row["machine_name"]: row for row in _records(machine_metrics)}
+        queue_analysis = self.analytics.generate_queue_analysis(phase_df)
+        self._queue_rows = {row["phase_name"]: row for row in _records(queue_analysis)}
+
+    def _apply_order(self, doc_id: Any, order: Optional[Dict]) -> Dict[str, Any]:
+        delta: Dict[str, Any] = {"type": "order"}
+
+        # Compute the new rows first, so a malformed order leaves state untouched
+        rows: Dict[Any, Dict[str, Any]] = {}
+        shares: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+        if order is not None:
+            rows, shares, _ = self._decode([order], [doc_id])
+
+        old_row = self._timeline_rows.pop(doc_id, None)
+        if old_row is not None:
+            self._count_order(old_row, -1)
+        affected = set(self._order_machines.pop(doc_id, set()))
+        for machine_name in affected:
+            self._machine_aggregates[machine_name].remove(doc_id)
+
+        if order is None:
+            delta["removed_orders"] = [self._order_ids.pop(doc_id, str(doc_id))]
+        else:
+            self._order_ids[doc_id] = order.get("orderId", "")
+            row = rows.get(doc_id)
+            if row is not None:
+                self._timeline_rows[doc_id] = row
+                self._count_order(row, 1)
+                delta["orders"] = [row]
+            else:
+                # Quarantined: subscribers drop any row they still hold for it
+                delta["removed_orders"] = [self._order_ids[doc_id]]
+
+            machines = set()
+            for (_, machine_name), share in shares.items():
+                self._machine_aggregates.setdefault(machine_name, _MachineAggregate()).add(doc_id, share)
+                machines.add(machine_name)
+            if machines:
+                self._order_machines[doc_id] = machines
+            affected |= machines
+
+        delta.update(self._refresh_machines(affected))
+        return delta
+
+    def _apply_machine(self, doc_id: Any, machine: Optional[Dict]) -> Dict[str, Any]:
+        delta: Dict[str, Any] = {"type": "machine"}
+        affected = set()
+
+        old_name = self._machine_names.pop(doc_id, None)
+        if old_name is not None:
+            self._machines.pop(old_name, None)
+            affected.add(old_name)
+        if machine is not None:
+            name = machine.get("name", "")
+            self._machine_names[doc_id] = name
+            self._machines[name] = machine
+            affected.add(name)
+
+        delta.update(self._refresh_machines(affected))
+        return delta
+
+    def _refresh_machines(self, machine_names: set) -> Dict[str, Any]:
+        """Recompute machine and queue rows for `machine_names` from their aggregates."""
+        machine_rows: List[Dict[str, Any]] = []
+        removed: List[str] = []
+
+        for machine_name in machine_names:
+            aggregate = self._machine_aggregates.get(machine_name)
+            if aggregate is not None and not aggregate.shares:
+                del self._machine_aggregates[machine_name]
+                aggregate = None
+
+            machine = self._machines.get(machine_name)
+            if aggregate is not None and machine is not None:
+                row = self._machine_row(machine, aggregate)
+                self._machine_rows[machine_name] = row
+                machine_rows.append(row)
+            elif self._machine_rows.pop(machine_name, None) is not None:
+                removed.append(machine_name)
+
+            if aggregate is not None:
+                old_row = self._queue_rows.get(machine_name, {})
+                self._queue_rows[machine_name] = self._queue_row(
+                    machine_name, aggregate, old_row.get("is_bottleneck", False)
+                )
+            else:
+                self._queue_rows.pop(machine_name, None)
+
+        changed_queues = self._refresh_bottlenecks() | (machine_names & self._queue_rows.keys())
+
+        delta: Dict[str, Any] = {}
+        if machine_rows:
+            delta["machines"] = machine_rows
+        if removed:
+            delta["removed_machines"] = removed
+        if changed_queues:
+            delta["queues"] = [self._queue_rows[name] for name in sorted(changed_queues)]
+        return delta
+
+    def _machine_row(self, machine: Dict, aggregate: _MachineAggregate) -> Dict[str, Any]:
+        """A machine_metrics row (as calculate_machine_metrics) from running totals."""
+        totals = aggregate.totals
+
+        def mean(field: str, unit: float = 1) -> Optional[float]:
+            count = totals[f"{field}_count"]
+            return totals[f"{field}_sum"] / count / unit if count else None
+
+        avg_cycle_time = totals["cycle_sum"] / totals["phases"]
+        avg_actual_duration = mean("duration", MINUTE_MS)
+        efficiency = (
+            avg_cycle_time / avg_actual_duration * 100
+            if avg_cycle_time > 0 and avg_actual_duration is not None
+            else None
+        )
+
+        # Utilization over whole days between the first start and last finish
+        utilization = None
+        extremes = aggregate.extremes()
+        if totals["finished"] and None not in (extremes["first_start"], extremes["last_finish"]):
+            working_days = (extremes["last_finish"] - extremes["first_start"]) // DAY_MS
+            if working_days > 0:
+                total_actual_minutes = totals["duration_sum"] / MINUTE_MS
+                utilization = total_actual_minutes / (working_days * 8 * 60) * 100
+
+        return {
+            "machine_name": machine.get("name", ""),
+            "is_active": machine.get("macchinarioActive", False),
+            "queue_target_time": self.analytics._parse_number_int(machine.get("queueTargetTime", None)),
+            "current_queue_length": len(machine.get("tablet", [])),
+            "total_phases_processed": int(totals["phases"]),
+            "completed_phases": int(totals["completed"]),
+            "in_progress_phases": int(totals["in_progress"]),
+            "avg_cycle_time": float(avg_cycle_time),
+            "avg_actual_duration": avg_actual_duration,
+            "avg_queue_delay": mean("queue_delay", HOUR_MS),
+            "avg_finish_delay": mean("finish_delay", HOUR_MS),
+            "total_quantity_processed": int(totals["quantity_sum"]),
+            "unique_operators": len(aggregate.operators),
+            "efficiency_percentage": efficiency,
+            "utilization_percentage": utilization,
+        }
+
+    @staticmethod
+    def _queue_row(machine_name: str, aggregate: _MachineAggregate, is_bottleneck: bool) -> Dict[str, Any]:
+        """A queue_analysis row (as generate_queue_analysis) from running totals."""
+        totals = aggregate.totals
+        count = totals["queue_delay_count"]
+        mean = totals["queue_delay_sum"] / HOUR_MS / count if count else None
+        std = None
+        if count > 1:
+            variance = (totals["queue_delay_sq_sum"] - count * mean ** 2) / (count - 1)
+            std = round(math.sqrt(max(variance, 0)), 2)
+        max_delay = aggregate.extremes()["max_queue_delay"]
+        return {
+            "phase_name": machine_name,
+            "avg_queue_delay": round(mean, 2) if mean is not None else None,
+            "queue_delay_std": std,
+            "max_queue_delay": round(max_delay / HOUR_MS, 2) if max_delay is not None else None,
+            "total_jobs": int(totals["jobs"]),
+            "total_quantity": int(totals["quantity_sum"]),
+            "is_bottleneck": is_bottleneck,
+        }
+
+    def _refresh_bottlenecks(self) -> set:
+        """Re-flag bottlenecks (same rule as generate_queue_analysis).
+
+        Returns the machine names whose flag changed.
+        """
+        if not self._queue_rows:
+            return set()
+        delays = pd.Series(
+            {name: row["avg_queue_delay"] for name, row in self._queue_rows.items()},
+            dtype=float,
+        )
+        flags = delays > delays.mean() + delays.std()
+        changed = set()
+        for name, flag in flags.items():
+            if self._queue_rows[name].get("is_bottleneck") != bool(flag):
+                self._queue_rows[name]["is_bottleneck"] = bool(flag)
+                changed.add(name)
+        return changed
+
+    def _count_order(self, row: Dict[str, Any], sign: int):
+        totals = self._totals
+        totals["total_orders"] += sign
+        if row.get("order_status") == 4:
+            totals["completed_orders"] += sign
+        if row.get("on_time") is not None:
+            totals["on_time_known"] += sign
+            totals["on_time_orders"] += sign * int(bool(row["on_time"]))
+        if row.get("lead_time_days") is not None:
+            totals["lead_time_count"] += sign
+            totals["lead_time_sum"] += sign * row["lead_time_days"]
+
+    def _kpis(self) -> Dict[str, Any]:
+        totals = self._totals
+        return {
+            "total_orders": totals["total_orders"],
+            "completed_orders": totals["completed_orders"],
+            "active_machines": len(
+                [m for m in self._machines.values() if m.get("macchinarioActive", False)]
+            ),
+            "total_machines": len(self._machines),
+            "avg_order_lead_time": totals["lead_time_sum"] / totals["lead_time_count"]
+            if totals["lead_time_count"]
+            else None,
+            "on_time_delivery_rate": totals["on_time_orders"] / totals["on_time_known"] * 100
+            if totals["on_time_known"]
+            else 0,
+            "bottleneck_machines": sorted(
+                name for name, row in self._queue_rows.items() if row.get("is_bottleneck")
+            ),
+        }
@@ -1,24 +1,172 @@
 import os
+import shutil
+import threading
+import time
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from pymongo import MongoClient
-import mongomock
-from typing import List, Dict, Any
+from pymongo.errors import ExecutionTimeout
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import csv
 import json
 from collections import defaultdict
+from itertools import combinations
+
+from bulk_decode import decode_dates, decode_ints, to_timezone
+from data_quality import ORDER_RULES, PHASE_RULES, validate
+
+
+# Dimensions of the order cube, from coarsest to finest. A cell whose value for
+# a dimension is CUBE_ALL is the roll-up over every value of that dimension.
+CUBE_DIMENSIONS = ["product_family", "article_code", "priority", "period"]
+CUBE_ALL = "*"
+CUBE_MEASURES = [
+    "orders",
+    "on_time_known",
+    "on_time_orders",
+    "lead_time_count",
+    "lead_time_sum",
+    "lead_time_sq_sum",
+    "lead_time_min",
+    "lead_time_max",
+    "delay_count",
+    "delay_sum",
+    "delay_min",
+    "delay_max",
+]
+# Per-cell quantile sketch: fixed-bin histograms of lead time and delay (days).
+# Bin i counts values in [edges[i], edges[i + 1]); the first bin also takes
+# anything below edges[0] and the last one is open-ended. Bin counts add up
+# under roll-up like every other count, so any slice's median/percentiles can
+# be estimated with `histogram_quantile`.
+LEAD_TIME_BIN_EDGES = [0, 1, 2, 3, 5, 7, 10, 14, 21, 30, 45, 60, 90, 120, 180, 365]
+DELAY_BIN_EDGES = [-30, -14, -7, -3, -1, 0, 1, 3, 7, 14, 30, 60, 90]
+LEAD_TIME_BINS = [f"lead_time_bin_{i:02d}" for i in range(len(LEAD_TIME_BIN_EDGES))]
+DELAY_BINS = [f"delay_bin_{i:02d}" for i in range(len(DELAY_BIN_EDGES))]
+CUBE_MEASURES += LEAD_TIME_BINS + DELAY_BINS
+
+def histogram_bins(values: pd.Series, edges: List[float], columns: List[str]) -> Dict[str, Any]:
+    """One 0/1 column per bin; missing values fall in no bin."""
+    index = np.searchsorted(edges, values.to_numpy(dtype="float64"), side="right") - 1
+    index = np.where(values.notna().to_numpy(), index.clip(0), -1)
+    return {column: (index == i).astype(int) for i, column in enumerate(columns)}
+
+
+def histogram_quantile(
+    counts: List[int], edges: List[float], q: float, minimum: float, maximum: float
+) -> Optional[float]:
+    """
+    Estimate the q-quantile (0..1) from bin counts, interpolating linearly
+    inside the bin it falls in. The cell's exact min/max bound the first and
+    last (open-ended) bins and tighten every other one.
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= target:
+            low = max(edges[i] if i > 0 else minimum, minimum)
+            high = min(edges[i + 1] if i + 1 < len(edges) else maximum, maximum)
+            return low + (high - low) * (target - seen) / count
+        seen += count
+    return maximum
+
+
+# Stage checkpoints of an in-progress run live in <output_dir>/CHECKPOINT_DIR
+CHECKPOINT_DIR = ".checkpoint"
+# Default age after which a checkpoint is discarded instead of resumed; keep it
+# around one schedule interval so a resumed run never reuses an older fetch
+CHECKPOINT_MAX_AGE_MINUTES = 60
+
+
+class RunCheckpoint:
+    """
+    Per-stage results of an in-progress `export_to_csv` run.
+
+    Each stage's results are pickled to `<stage>.pkl` and the stage is then
+    recorded in `manifest.json` (written atomically), so a stage only counts
+    as finished once its results are safely on disk. Checkpoints older than
+    `max_age` seconds are discarded rather than resumed. Messages go to `log`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_age: float = CHECKPOINT_MAX_AGE_MINUTES * 60,
+        log: Callable[[str], None] = print,
+    ):
+        self.directory = directory
+        self.max_age = max_age
+        self.log = log
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.completed_stages: List[str] = []
+
+    def load(self) -> Dict[str, Any]:
+        """Return the merged results of all checkpointed stages."""
+        self.completed_stages = []
+        if not os.path.exists(self.manifest_path):
+            return {}
+
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        created = datetime.fromisoformat(manifest["created"])
+        if datetime.now() - created > timedelta(seconds=self.max_age):
+            self.log("Discarding stale checkpoint")
+            self.clear()
+            return {}
+
+        results: Dict[str, Any] = {}
+        for stage in manifest["completed_stages"]:
+            results.update(pd.read_pickle(os.path.join(self.directory, f"{stage}.pkl")))
+            self.completed_stages.append(stage)
+        return results
+
+    def save(self, stage: str, stage_results: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        pd.to_pickle(stage_results, os.path.join(self.directory, f"{stage}.pkl"))
+
+        created = datetime.now().isoformat()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                created = json.load(f)["created"]
+        self.completed_stages.append(stage)
+
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"created": created, "completed_stages": self.completed_stages}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.completed_stages = []
 
 
 class ManufacturingAnalytics:
-    def __init__(self, mongo_uri: str, orders_db: str, process_db: str | None = None):
+    def __init__(
+        self,
+        mongo_uri: str,
+        orders_db: str,
+        process_db: str | None = None,
+        client: MongoClient | None = None,
+        timezone: str = "UTC",
+        label: str | None = None,
+    ):
         """Initialize the analytics service with MongoDB connection.
 
         - `orders_db` contains the production orders.
         - `process_db` stores the machine cluster info. If `process_db` is None,
           we use `orders_db` for both collections.
+        - `client` is an existing (shared) MongoClient for `mongo_uri`; if None,
+          a new one is created.
+        - `timezone` is the IANA zone dates are reported in; MongoDB stores
+          them in UTC.
+        - `label` (e.g. the plant id) prefixes the progress messages, so
+          concurrent runs can be told apart in the log.
         """
-        self.client = MongoClient(mongo_uri)
+        self.client = client if client is not None else MongoClient(mongo_uri)
 
         self.orders_db = self.client[orders_db]
         self.orders_collection = self.orders_db["newOrdini"]
@@ -26,30 +174,19 @@ class ManufacturingAnalytics:
         self.process_db = self.client[process_db] if process_db else self.orders_db
         self.machines_collection = self.process_db["macchinari"]
 
-    @staticmethod
-    def _parse_date(field: Any) -> Any:
-        """
-        Accepts either:
-          1) a Python `datetime` (in which case we just return it),
-          2) a MongoDB‐style dict {"$date": {"$numberLong": "..."}}, or
-          3) None/empty.
-        Returns a `datetime` or `None`.
-        """
-        if isinstance(field, datetime):
-            return field
-
-        if not field:
-            return None
+        # time.monotonic() deadline of the running export, bounding its queries
+        self._deadline: Optional[float] = None
 
-        if isinstance(field, dict):
-            date_obj = field.get("$date", None)
-            if isinstance(date_obj, dict):
-                millis = date_obj.get("$numberLong", None)
-                if millis is not None:
-                    # convert from milliseconds to seconds‐timestamp
-                    return datetime.fromtimestamp(int(millis) / 1000)
+        self.timezone = timezone
+        self.label = label
 
-        return None
+    def _progress(self, message: str):
+        """Print a progress message, each line prefixed with `self.label` if set."""
+        if self.label:
+            message = "\n".join(
+                f"[{self.label}] {line}" if line else line for line in message.split("\n")
+            )
+        print(message)
 
     @staticmethod
     def _parse_number_int(field_value: Any) -> int:
@@ -67,112 +204,93 @@ class ManufacturingAnalytics:
         else:
             return int(field_value)
 
-    def extract_phase_metrics(self, orders: List[Dict]) -> pd.DataFrame:
-        """Extract detailed phase‐level metrics from the list of `orders`."""
-        phase_data: List[Dict[str, Any]] = []
-
-        for order in orders:
-            order_id = order.get("orderId", "")
-            order_status = self._parse_number_int(order.get("orderStatus", None))
-            order_quantity = self._parse_number_int(order.get("quantity", None))
-
-            phases = order.get("Phases", [])
-            for phase in phases:
-                # 1) Pull out numeric fields via _parse_number_int
-                raw_cycle_time = phase.get("cycleTime", None)
-                raw_real_time = phase.get("phaseRealTime", None)
-                raw_declared_qty = phase.get("declaredQuantity", None)
-
-                cycle_time = self._parse_number_int(raw_cycle_time)
-                phase_real_time = self._parse_number_int(raw_real_time)
-                declared_quantity = (
-                    self._parse_number_int(raw_declared_qty) if raw_declared_qty is not None else 0
-                )
-
-                # 2) Operators → comma‐joined string + count
-                operators_list = phase.get("operators", [])
-                operator_str = ",".join(operators_list)
-                operator_count = len(operators_list)
-
-                # 3) Build the base record
-                phase_record: Dict[str, Any] = {
-                    "order_id": order_id,
-                    "order_status": order_status,
-                    "order_quantity": order_quantity,
-                    "phase_id": phase.get("phaseId", ""),
-                    "phase_name": phase.get("phaseName", ""),
-                    "phase_status": self._parse_number_int(phase.get("phaseStatus", None)),
-                    "cycle_time": cycle_time,
-                    "phase_real_time": phase_real_time,
-                    "declared_quantity": declared_quantity,
-                    "operators": operator_str,
-                    "operator_count": operator_count,
-                }
-
-                # 4) Parse all four possible date fields
-                #    (queueInsertDate, queueRealInsertDate, finishDate, realFinishDate)
-                phase_record["queue_insert_date"] = self._parse_date(
-                    phase.get("queueInsertDate", None)
-                )
-                phase_record["queue_real_insert_date"] = self._parse_date(
-                    phase.get("queueRealInsertDate", None)
-                )
-                phase_record["planned_finish_date"] = self._parse_date(
-                    phase.get("finishDate", None)
-                )
-                phase_record["real_finish_date"] = self._parse_date(
-                    phase.get("realFinishDate", None)
-                )
-
-                # 5) Calculate queue‐delay hours if both dates are present
-                if (
-                    phase_record["queue_insert_date"]
-                    and phase_record["queue_real_insert_date"]
-                ):
-                    delta = (
-                        phase_record["queue_real_insert_date"]
-                        - phase_record["queue_insert_date"]
-                    ).total_seconds() / 3600
-                    phase_record["queue_delay_hours"] = delta
-                else:
-                    phase_record["queue_delay_hours"] = None
-
-                # 6) Calculate finish‐delay hours if both planned + actual finish exist
-                if (
-                    phase_record["planned_finish_date"]
-                    and phase_record["real_finish_date"]
-                ):
-                    delta = (
-                        phase_record["real_finish_date"]
-                        - phase_record["planned_finish_date"]
-                    ).total_seconds() / 3600
-                    phase_record["finish_delay_hours"] = delta
-                else:
-                    phase_record["finish_delay_hours"] = None
-
-                # 7) Actual duration (minutes) = difference between queue_real_insert_date and real_finish_date
-                if (
-                    phase_record["queue_real_insert_date"]
-                    and phase_record["real_finish_date"]
-                ):
-                    delta = (
-                        phase_record["real_finish_date"]
-                        - phase_record["queue_real_insert_date"]
-                    ).total_seconds() / 60
-                    phase_record["actual_duration_minutes"] = delta
-                else:
-                    phase_record["actual_duration_minutes"] = None
-
-                # 8) Planned duration = cycle_time × declared_quantity (if declared_quantity > 0),
-                #    otherwise just cycle_time
-                if declared_quantity > 0:
-                    phase_record["planned_duration_minutes"] = cycle_time * declared_quantity
-                else:
-                    phase_record["planned_duration_minutes"] = cycle_time
+    def decode_orders(self, orders: List[Dict]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Decode the raw `newOrdini` documents into typed tables, once per run.
+
+        Returns (orders, phases): one row per order and one row per phase.
+        Each field is gathered into a column and decoded in bulk (see
+        bulk_decode), so numbers come out as int64 and dates as UTC
+        datetime64. Durations, delays and rule checks are computed in UTC, so
+        they stay right across DST changes; dates are only converted to
+        `self.timezone` when written (`localize_dates`). Reports and the
+        summary reuse these columns instead of parsing the documents again.
+        """
+        dates = decode_dates
+
+        # 1) Order-level fields
+        order_df = pd.DataFrame(
+            {
+                "order_id": [o.get("orderId", "") for o in orders],
+                "article_code": [o.get("codiceArticolo", "") for o in orders],
+                "product_family": [o.get("famigliaDiProdotto", "") for o in orders],
+                "quantity": decode_ints([o.get("quantity") for o in orders]),
+                "priority": decode_ints([o.get("priority") for o in orders]),
+                "order_status": decode_ints([o.get("orderStatus") for o in orders]),
+                "insert_date": dates([o.get("orderInsertDate") for o in orders]),
+                "start_date": dates([o.get("orderStartDate") for o in orders]),
+                "deadline": dates([o.get("orderDeadline") for o in orders]),
+                "real_finish_date": dates([o.get("realOrderFinishDate") for o in orders]),
+            }
+        )
 
-                phase_data.append(phase_record)
+        # 2) Flatten the phases, remembering which order each one belongs to
+        phase_lists = [o.get("Phases") or [] for o in orders]
+        phases = [phase for phase_list in phase_lists for phase in phase_list]
+        owner = np.repeat(
+            np.arange(len(orders)), [len(phase_list) for phase_list in phase_lists]
+        )
+        operators = [phase.get("operators") or [] for phase in phases]
+
+        phase_df = pd.DataFrame(
+            {
+                "order_id": order_df["order_id"].to_numpy()[owner],
+                "order_status": order_df["order_status"].to_numpy()[owner],
+                "order_quantity": order_df["quantity"].to_numpy()[owner],
+                "phase_id": [p.get("phaseId", "") for p in phases],
+                "phase_name": [p.get("phaseName", "") for p in phases],
+                "phase_status": decode_ints([p.get("phaseStatus") for p in phases]),
+                "cycle_time": decode_ints([p.get("cycleTime") for p in phases]),
+                "phase_real_time": decode_ints([p.get("phaseRealTime") for p in phases]),
+                "declared_quantity": decode_ints([p.get("declaredQuantity") for p in phases]),
+                "operators": [",".join(names) for names in operators],
+                "operator_count": np.array([len(names) for names in operators], dtype=np.int64),
+                "queue_insert_date": dates([p.get("queueInsertDate") for p in phases]),
+                "queue_real_insert_date": dates([p.get("queueRealInsertDate") for p in phases]),
+                "planned_finish_date": dates([p.get("finishDate") for p in phases]),
+                "real_finish_date": dates([p.get("realFinishDate") for p in phases]),
+            }
+        )
+        return order_df, phase_df
+
+    def build_phase_metrics(self, decoded_phases: pd.DataFrame) -> pd.DataFrame:
+        """Add the per-phase delay and duration metrics to the decoded phases."""
+        phase_df = decoded_phases.copy()
+        hour, minute = pd.Timedelta(hours=1), pd.Timedelta(minutes=1)
+
+        # Delays and actual duration are NaN wherever one of the dates is missing
+        phase_df["queue_delay_hours"] = (
+            phase_df["queue_real_insert_date"] - phase_df["queue_insert_date"]
+        ) / hour
+        phase_df["finish_delay_hours"] = (
+            phase_df["real_finish_date"] - phase_df["planned_finish_date"]
+        ) / hour
+        phase_df["actual_duration_minutes"] = (
+            phase_df["real_finish_date"] - phase_df["queue_real_insert_date"]
+        ) / minute
+
+        # Planned duration = cycle_time × declared_quantity (if declared_quantity > 0),
+        # otherwise just cycle_time
+        phase_df["planned_duration_minutes"] = np.where(
+            phase_df["declared_quantity"] > 0,
+            phase_df["cycle_time"] * phase_df["declared_quantity"],
+            phase_df["cycle_time"],
+        )
+        return phase_df
 
-        return pd.DataFrame(phase_data)
+    def extract_phase_metrics(self, orders: List[Dict]) -> pd.DataFrame:
+        """Extract detailed phase‐level metrics from the list of `orders`."""
+        return self.build_phase_metrics(self.decode_orders(orders)[1])
 
     def calculate_machine_metrics(
         self, phase_df: pd.DataFrame, machines: List[Dict]
@@ -271,56 +389,236 @@ class ManufacturingAnalytics:
 
         return pd.DataFrame(machine_metrics)
 
+    def build_order_timeline(self, decoded_orders: pd.DataFrame) -> pd.DataFrame:
+        """Add lead time, delay and on_time to the decoded orders."""
+        order_timeline = decoded_orders.copy()
+
+        # Lead time / delay in whole days (NaN if either date is missing)
+        order_timeline["lead_time_days"] = (
+            order_timeline["real_finish_date"] - order_timeline["insert_date"]
+        ).dt.days
+        delay_days = (order_timeline["real_finish_date"] - order_timeline["deadline"]).dt.days
+        order_timeline["delay_days"] = delay_days
+        # True/False, or None when the delay is unknown
+        order_timeline["on_time"] = (delay_days <= 0).astype(object).where(delay_days.notna(), None)
+        return order_timeline
+
     def generate_order_timeline(self, orders: List[Dict]) -> pd.DataFrame:
         """Generate timeline data for each order (lead times, delays, on_time, etc.)."""
-        timeline_data: List[Dict[str, Any]] = []
-
-        for order in orders:
-            order_id = order.get("orderId", "")
-            article_code = order.get("codiceArticolo", "")
-            product_family = order.get("famigliaDiProdotto", "")
-
-            quantity = self._parse_number_int(order.get("quantity", None))
-            priority = self._parse_number_int(order.get("priority", None))
-            order_status = self._parse_number_int(order.get("orderStatus", None))
-
-            # Reuse the same _parse_date helper
-            insert_date = self._parse_date(order.get("orderInsertDate", None))
-            start_date = self._parse_date(order.get("orderStartDate", None))
-            deadline = self._parse_date(order.get("orderDeadline", None))
-            real_finish_date = self._parse_date(order.get("realOrderFinishDate", None))
-
-            record: Dict[str, Any] = {
-                "order_id": order_id,
-                "article_code": article_code,
-                "product_family": product_family,
-                "quantity": quantity,
-                "priority": priority,
-                "order_status": order_status,
-                "insert_date": insert_date,
-                "start_date": start_date,
-                "deadline": deadline,
-                "real_finish_date": real_finish_date,
+        return self.build_order_timeline(self.decode_orders(orders)[0])
+
+    def generate_order_cube(self, order_timeline: pd.DataFrame) -> pd.DataFrame:
+        """
+        Pre-aggregate the order timeline into an OLAP cube.
+
+        One row per non-empty cell of every grouping set over CUBE_DIMENSIONS
+        (period = month of the insert date, "YYYY-MM"); rolled-up dimensions hold
+        CUBE_ALL. Measures are additive (counts, sums, sum of squares) or
+        mergeable (min/max), so rates, averages and std can be derived per cell:
+          - on_time_delivery_rate = on_time_orders / on_time_known * 100
+          - avg_lead_time = lead_time_sum / lead_time_count
+          - avg_delay = delay_sum / delay_count
+          - lead time / delay percentiles from the lead_time_bin_* / delay_bin_*
+            histograms (see LEAD_TIME_BIN_EDGES, histogram_quantile)
+        """
+        if order_timeline.empty:
+            return pd.DataFrame(columns=CUBE_DIMENSIONS + CUBE_MEASURES)
+
+        lead_time = pd.to_numeric(order_timeline["lead_time_days"], errors="coerce")
+        delay = pd.to_numeric(order_timeline["delay_days"], errors="coerce")
+        on_time = order_timeline["on_time"]
+
+        base = pd.DataFrame(
+            {
+                "product_family": order_timeline["product_family"].fillna("").astype(str),
+                "article_code": order_timeline["article_code"].fillna("").astype(str),
+                "priority": order_timeline["priority"].astype(str),
+                "period": to_timezone(order_timeline["insert_date"], self.timezone)
+                .dt.strftime("%Y-%m")
+                .fillna(""),
+                "orders": 1,
+                "on_time_known": on_time.notna().astype(int),
+                "on_time_orders": (on_time == True).astype(int),  # noqa: E712
+                "lead_time_count": lead_time.notna().astype(int),
+                "lead_time_sum": lead_time.fillna(0),
+                "lead_time_sq_sum": (lead_time ** 2).fillna(0),
+                "lead_time_min": lead_time,
+                "lead_time_max": lead_time,
+                "delay_count": delay.notna().astype(int),
+                "delay_sum": delay.fillna(0),
+                "delay_min": delay,
+                "delay_max": delay,
+                **histogram_bins(lead_time, LEAD_TIME_BIN_EDGES, LEAD_TIME_BINS),
+                **histogram_bins(delay, DELAY_BIN_EDGES, DELAY_BINS),
             }
+        )
 
-            # Lead time in days = (real_finish_date − insert_date).days, if both exist
-            if insert_date and real_finish_date:
-                record["lead_time_days"] = (real_finish_date - insert_date).days
-            else:
-                record["lead_time_days"] = None
+        aggregations = {
+            measure: "min" if measure.endswith("_min")
+            else "max" if measure.endswith("_max")
+            else "sum"
+            for measure in CUBE_MEASURES
+        }
 
-            # Delay in days & on_time flag
-            if deadline and real_finish_date:
-                delay_days = (real_finish_date - deadline).days
-                record["delay_days"] = delay_days
-                record["on_time"] = delay_days <= 0
-            else:
-                record["delay_days"] = None
-                record["on_time"] = None
+        # Aggregate the orders once at the finest grain; every roll-up is then
+        # computed from these cells instead of rescanning the timeline.
+        finest = base.groupby(CUBE_DIMENSIONS, sort=False).agg(aggregations).reset_index()
+
+        cells: List[pd.DataFrame] = []
+        for depth in range(len(CUBE_DIMENSIONS), -1, -1):
+            for kept in combinations(CUBE_DIMENSIONS, depth):
+                if kept:
+                    grouped = (
+                        finest.groupby(list(kept), sort=False)
+                        .agg(aggregations)
+                        .reset_index()
+                    )
+                else:
+                    grouped = finest.agg(aggregations).to_frame().T
+                for dimension in CUBE_DIMENSIONS:
+                    if dimension not in kept:
+                        grouped[dimension] = CUBE_ALL
+                cells.append(grouped[CUBE_DIMENSIONS + CUBE_MEASURES])
+
+        cube = pd.concat(cells, ignore_index=True)
+        counts = [
+            "orders", "on_time_known", "on_time_orders", "lead_time_count", "delay_count"
+        ] + LEAD_TIME_BINS + DELAY_BINS
+        cube[counts] = cube[counts].astype("int64")
+        return cube
+
+    def generate_wait_attribution(
+        self, phase_df: pd.DataFrame, order_timeline: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Split each order's lead time into processing, queue-wait and hand-off hours per phase_name.
+
+        Phases with both a real queue insert and a real finish date are ordered
+        by time within their order. A phase becomes ready when every earlier
+        phase of the order has finished (the order insert date for the first).
+        The phase then spends [queue entry, real finish] at the machine:
+          - processing = the phase's own working time: phase_real_time, or
+            planned_duration_minutes (cycle_time × declared_quantity) when
+            that is 0, capped at the time spent at the machine
+          - queue_wait = time at the machine − processing, charged to the
+            machine whose queue the order waited in
+          - handoff = real queue insert − ready time (≥ 0): the gap between
+            the previous phase finishing and the order reaching this queue
+        The time at the machine starts at max(real queue insert, ready time),
+        so overlapping phases are not counted twice. Computed with a sorted
+        groupby + cummax/shift, without per-order loops.
+        """
+        columns = [
+            "order_id",
+            "phase_name",
+            "phases",
+            "processing_hours",
+            "queue_wait_hours",
+            "handoff_hours",
+            "on_time",
+        ]
+        if phase_df.empty or "phase_name" not in phase_df.columns:
+            return pd.DataFrame(columns=columns)
 
-            timeline_data.append(record)
+        own_minutes = phase_df["phase_real_time"].where(
+            phase_df["phase_real_time"] > 0, phase_df["planned_duration_minutes"]
+        )
+        phases = pd.DataFrame(
+            {
+                "order_id": phase_df["order_id"],
+                "phase_name": phase_df["phase_name"],
+                "start": pd.to_datetime(phase_df["queue_real_insert_date"]),
+                "finish": pd.to_datetime(phase_df["real_finish_date"]),
+                "own_hours": own_minutes.clip(lower=0) / 60,
+            }
+        ).dropna(subset=["start", "finish"])
+        if phases.empty:
+            return pd.DataFrame(columns=columns)
 
-        return pd.DataFrame(timeline_data)
+        orders = order_timeline[["order_id", "insert_date", "on_time"]].drop_duplicates("order_id")
+        phases = phases.merge(orders, on="order_id", how="left")
+        phases = phases.sort_values(["order_id", "start", "finish"], kind="mergesort")
+
+        # Ready time = latest finish among the order's earlier phases
+        ready = phases.groupby("order_id", sort=False)["finish"].cummax()
+        ready = ready.groupby(phases["order_id"], sort=False).shift(1)
+        ready = ready.fillna(pd.to_datetime(phases["insert_date"])).fillna(phases["start"])
+
+        phases["handoff_hours"] = (
+            (phases["start"] - ready).dt.total_seconds().clip(lower=0) / 3600
+        )
+        at_machine_hours = (
+            (phases["finish"] - phases["start"].where(phases["start"] > ready, ready))
+            .dt.total_seconds()
+            .clip(lower=0)
+            / 3600
+        )
+        phases["processing_hours"] = np.minimum(phases["own_hours"], at_machine_hours)
+        phases["queue_wait_hours"] = at_machine_hours - phases["processing_hours"]
+
+        attribution = (
+            phases.groupby(["order_id", "phase_name"], sort=False)
+            .agg(
+                phases=("phase_name", "size"),
+                processing_hours=("processing_hours", "sum"),
+                queue_wait_hours=("queue_wait_hours", "sum"),
+                handoff_hours=("handoff_hours", "sum"),
+                on_time=("on_time", "first"),
+            )
+            .reset_index()
+        )
+        return attribution[columns]
+
+    def generate_delay_contribution(self, wait_attribution: pd.DataFrame) -> pd.DataFrame:
+        """
+        Total each machine's contribution to order lead time.
+
+        Per phase_name: orders/phases touched, processing, queue-wait and
+        hand-off hours, queue-wait hours spent by late orders, and the
+        machine's share of all queue wait (%). Sorted by late-order wait, the
+        biggest culprits first.
+        """
+        columns = [
+            "phase_name",
+            "orders",
+            "phases",
+            "total_processing_hours",
+            "total_queue_wait_hours",
+            "total_handoff_hours",
+            "avg_queue_wait_hours",
+            "late_order_queue_wait_hours",
+            "queue_wait_share",
+        ]
+        if wait_attribution.empty:
+            return pd.DataFrame(columns=columns)
+
+        late = (wait_attribution["on_time"] == False)  # noqa: E712
+        contribution = (
+            wait_attribution.assign(
+                late_wait=wait_attribution["queue_wait_hours"].where(late, 0)
+            )
+            .groupby("phase_name")
+            .agg(
+                orders=("order_id", "nunique"),
+                phases=("phases", "sum"),
+                total_processing_hours=("processing_hours", "sum"),
+                total_queue_wait_hours=("queue_wait_hours", "sum"),
+                total_handoff_hours=("handoff_hours", "sum"),
+                late_order_queue_wait_hours=("late_wait", "sum"),
+            )
+            .reset_index()
+        )
+        contribution["avg_queue_wait_hours"] = (
+            contribution["total_queue_wait_hours"] / contribution["orders"]
+        )
+        total_wait = contribution["total_queue_wait_hours"].sum()
+        contribution["queue_wait_share"] = (
+            contribution["total_queue_wait_hours"] / total_wait * 100 if total_wait > 0 else 0.0
+        )
+        contribution = contribution.sort_values(
+            ["late_order_queue_wait_hours", "total_queue_wait_hours"], ascending=False
+        )
+        return contribution[columns].round(2).reset_index(drop=True)
 
     def generate_queue_analysis(self, phase_df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -434,51 +732,125 @@ class ManufacturingAnalytics:
         ).round(2)
         return operator_metrics.reset_index()
 
-    def export_to_csv(self, output_dir: str = "./analytics_output"):
-        """Fetch data from MongoDB, compute all analytics, and write CSV + JSON files."""
-        os.makedirs(output_dir, exist_ok=True)
+    def localize_dates(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Return `df` with its UTC date columns as wall-clock time in `self.timezone`."""
+        columns = df.select_dtypes(include="datetimetz").columns
+        if columns.empty:
+            return df
+        df = df.copy()
+        for column in columns:
+            df[column] = to_timezone(df[column], self.timezone)
+        return df
+
+    def _write_csv(self, df: pd.DataFrame, output_dir: str, filename: str):
+        """Write a report atomically, so readers never see a half-written file.
+
+        Dates are written as wall-clock time in `self.timezone`.
+        """
+        path = os.path.join(output_dir, filename)
+        self.localize_dates(df).to_csv(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
 
-        # 1) Fetch raw data
-        orders = list(self.orders_collection.find())
-        machines = list(self.machines_collection.find())
-
-        # 2) Phase‐level
-        print("Extracting phase metrics...")
-        phase_df = self.extract_phase_metrics(orders)
-        phase_df.to_csv(f"{output_dir}/phase_metrics.csv", index=False)
-
-        # 3) Machine‐level
-        print("Calculating machine metrics...")
-        machine_metrics = self.calculate_machine_metrics(phase_df, machines)
-        machine_metrics.to_csv(f"{output_dir}/machine_metrics.csv", index=False)
-
-        # 4) Order timeline
-        print("Generating order timeline...")
-        order_timeline = self.generate_order_timeline(orders)
-        order_timeline.to_csv(f"{output_dir}/order_timeline.csv", index=False)
-
-        # 5) Queue/bottleneck analysis
-        print("Analyzing queue patterns...")
-        queue_analysis = self.generate_queue_analysis(phase_df)
-        queue_analysis.to_csv(f"{output_dir}/queue_analysis.csv", index=False)
-
-        # 6) Operator performance
-        print("Calculating operator performance...")
-        operator_performance = self.generate_operator_performance(phase_df)
-        operator_performance.to_csv(
-            f"{output_dir}/operator_performance.csv", index=False
+    def _remaining_ms(self) -> Optional[int]:
+        """Time left before the run's deadline, as a MongoDB max_time_ms."""
+        if self._deadline is None:
+            return None
+        return max(int((self._deadline - time.monotonic()) * 1000), 1)
+
+    def _fetch_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        fetched_at = datetime.now().isoformat()
+        # The server aborts a query that would run past the time budget
+        # (ExecutionTimeout), so a slow fetch cannot overrun the run
+        return {
+            "orders": list(self.orders_collection.find(max_time_ms=self._remaining_ms())),
+            "machines": list(self.machines_collection.find(max_time_ms=self._remaining_ms())),
+            "fetched_at": fetched_at,
+        }
+
+    def _decode_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        decoded_orders, decoded_phases = self.decode_orders(results["orders"])
+        return {"decoded_orders": decoded_orders, "decoded_phases": decoded_phases}
+
+    def _validate_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        valid_phases, quarantined_phases, phase_report = validate(
+            results["decoded_phases"], PHASE_RULES
+        )
+        valid_orders, quarantined_orders, order_report = validate(
+            results["decoded_orders"], ORDER_RULES
+        )
+        # Quarantined rows keep their derived metrics, so the anomaly is visible
+        self._write_csv(
+            self.build_phase_metrics(quarantined_phases), output_dir, "quarantined_phases.csv"
         )
+        self._write_csv(
+            self.build_order_timeline(quarantined_orders), output_dir, "quarantined_orders.csv"
+        )
+        return {
+            "valid_phases": valid_phases,
+            "valid_orders": valid_orders,
+            "data_quality": {"phases": phase_report, "orders": order_report},
+        }
 
-        # 7) Summary JSON
-        summary = {
-            "total_orders": len(orders),
-            "completed_orders": len(
-                [
-                    o
-                    for o in orders
-                    if self._parse_number_int(o.get("orderStatus", None)) == 4
-                ]
-            ),
+    def _phase_metrics_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        phase_df = self.build_phase_metrics(results["valid_phases"])
+        self._write_csv(phase_df, output_dir, "phase_metrics.csv")
+        return {"phase_df": phase_df}
+
+    def _machine_metrics_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        machine_metrics = self.calculate_machine_metrics(
+            results["phase_df"], results["machines"]
+        )
+        self._write_csv(machine_metrics, output_dir, "machine_metrics.csv")
+        return {"machine_metrics": machine_metrics}
+
+    def _order_timeline_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        order_timeline = self.build_order_timeline(results["valid_orders"])
+        self._write_csv(order_timeline, output_dir, "order_timeline.csv")
+        return {"order_timeline": order_timeline}
+
+    def _order_cube_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        order_cube = self.generate_order_cube(results["order_timeline"])
+        self._write_csv(order_cube, output_dir, "order_cube.csv")
+        return {}
+
+    def _queue_analysis_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        queue_analysis = self.generate_queue_analysis(results["phase_df"])
+        self._write_csv(queue_analysis, output_dir, "queue_analysis.csv")
+        return {"queue_analysis": queue_analysis}
+
+    def _operator_performance_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        operator_performance = self.generate_operator_performance(results["phase_df"])
+        self._write_csv(operator_performance, output_dir, "operator_performance.csv")
+        return {"operator_performance": operator_performance}
+
+    def _wait_attribution_stage(self, results: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+        wait_attribution = self.generate_wait_attribution(
+            results["phase_df"], results["order_timeline"]
+        )
+        self._write_csv(wait_attribution, output_dir, "order_wait_attribution.csv")
+        delay_contribution = self.generate_delay_contribution(wait_attribution)
+        self._write_csv(delay_contribution, output_dir, "machine_delay_contribution.csv")
+        return {}
+
+    def _build_summary(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Overall KPIs from whatever stages have completed (missing → None/0/[]).
+
+        Order counts cover the valid orders only, like every other KPI;
+        quarantined ones are counted under `data_quality`.
+        """
+        valid_orders = results.get("valid_orders", pd.DataFrame())
+        machines = results.get("machines", [])
+        order_timeline = results.get("order_timeline", pd.DataFrame())
+        machine_metrics = results.get("machine_metrics", pd.DataFrame())
+        queue_analysis = results.get("queue_analysis", pd.DataFrame())
+        operator_performance = results.get("operator_performance", pd.DataFrame())
+
+        return {
+            "data_fetched_at": results.get("fetched_at"),
+            "total_orders": len(valid_orders),
+            "completed_orders": int((valid_orders["order_status"] == 4).sum())
+            if "order_status" in valid_orders
+            else 0,
             "active_machines": len(
                 [m for m in machines if m.get("macchinarioActive", False)]
             ),
@@ -509,19 +881,118 @@ class ManufacturingAnalytics:
                 and "is_bottleneck" in queue_analysis.columns
                 else []
             ),
+            "data_quality": results.get("data_quality"),
         }
 
-        with open(f"{output_dir}/summary_statistics.json", "w") as f:
-            json.dump(summary, f, indent=2, default=str)
+    def export_to_csv(
+        self,
+        output_dir: str = "./analytics_output",
+        time_budget: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+        resume: bool = True,
+        checkpoint_max_age: float = CHECKPOINT_MAX_AGE_MINUTES * 60,
+    ):
+        """
+        Fetch data from MongoDB, compute all analytics, and write CSV + JSON files.
+
+        Each stage checkpoints its results under `<output_dir>/.checkpoint`, so a
+        run that crashed or was stopped resumes after its last finished stage
+        (pass `resume=False` to start over); checkpoints older than
+        `checkpoint_max_age` seconds are discarded. The summary records when
+        the data was fetched and which stages were resumed. Between stages the
+        run stops early if `cancel_event` is set or `time_budget` seconds have
+        elapsed, and the fetch queries are bounded by the remaining budget; the
+        summary is then still written, with `partial: true`, the stop reason
+        and the stages that did not run.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        started = time.monotonic()
+        self._deadline = started + time_budget if time_budget is not None else None
 
-        print(f"\nAnalytics exported to `{output_dir}/`")
-        print("\nGenerated files:")
-        print("- phase_metrics.csv: Detailed phase‐level data")
-        print("- machine_metrics.csv: Machine utilization & efficiency")
-        print("- order_timeline.csv: Order progress & delays")
-        print("- queue_analysis.csv: Queue patterns & bottlenecks")
-        print("- operator_performance.csv: Operator efficiency metrics")
-        print("- summary_statistics.json: Overall KPIs")
+        checkpoint = RunCheckpoint(
+            os.path.join(output_dir, CHECKPOINT_DIR), checkpoint_max_age, log=self._progress
+        )
+        if not resume:
+            checkpoint.clear()
+        results = checkpoint.load()
+        resumed_stages = list(checkpoint.completed_stages)
+        if resumed_stages:
+            self._progress(f"Resuming after stages: {', '.join(checkpoint.completed_stages)}")
+
+        stages = [
+            ("fetch", "Fetching orders and machines...", self._fetch_stage),
+            ("decode", "Decoding order documents...", self._decode_stage),
+            ("validate", "Validating phases and orders...", self._validate_stage),
+            ("phase_metrics", "Extracting phase metrics...", self._phase_metrics_stage),
+            ("machine_metrics", "Calculating machine metrics...", self._machine_metrics_stage),
+            ("order_timeline", "Generating order timeline...", self._order_timeline_stage),
+            ("order_cube", "Building order cube...", self._order_cube_stage),
+            ("queue_analysis", "Analyzing queue patterns...", self._queue_analysis_stage),
+            ("operator_performance", "Calculating operator performance...", self._operator_performance_stage),
+            ("wait_attribution", "Attributing order lead time to machine queues...", self._wait_attribution_stage),
+        ]
+
+        stopped_reason = None
+        for name, message, stage in stages:
+            if name in checkpoint.completed_stages:
+                continue
+            if cancel_event is not None and cancel_event.is_set():
+                stopped_reason = "cancelled"
+            elif time_budget is not None and time.monotonic() - started > time_budget:
+                stopped_reason = "time_budget_exceeded"
+            if stopped_reason:
+                break
+
+            self._progress(message)
+            try:
+                stage_results = stage(results, output_dir)
+            except ExecutionTimeout:
+                # A query was aborted by the server at the end of the budget
+                stopped_reason = "time_budget_exceeded"
+                break
+            results.update(stage_results)
+            checkpoint.save(name, stage_results)
+
+        self._deadline = None
+
+        summary = self._build_summary(results)
+        summary["resumed_stages"] = resumed_stages
+        if stopped_reason:
+            summary["partial"] = True
+            summary["stopped_reason"] = stopped_reason
+            summary["pending_stages"] = [
+                name for name, _, _ in stages if name not in checkpoint.completed_stages
+            ]
+        else:
+            summary["partial"] = False
+            checkpoint.clear()
+
+        if stopped_reason and not checkpoint.completed_stages:
+            # Nothing computed yet: keep the previous run's summary published
+            self._progress(f"\nRun stopped ({stopped_reason}) before any stage completed")
+            return summary
+
+        summary_path = f"{output_dir}/summary_statistics.json"
+        with open(f"{summary_path}.tmp", "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+        os.replace(f"{summary_path}.tmp", summary_path)
+
+        if stopped_reason:
+            self._progress(f"\nRun stopped ({stopped_reason}); partial analytics exported to `{output_dir}/`")
+            return summary
+
+        self._progress(f"\nAnalytics exported to `{output_dir}/`")
+        self._progress("\nGenerated files:")
+        self._progress("- phase_metrics.csv: Detailed phase‐level data")
+        self._progress("- machine_metrics.csv: Machine utilization & efficiency")
+        self._progress("- order_timeline.csv: Order progress & delays")
+        self._progress("- order_cube.csv: Order KPIs pre-aggregated by family/article/priority/month")
+        self._progress("- queue_analysis.csv: Queue patterns & bottlenecks")
+        self._progress("- operator_performance.csv: Operator efficiency metrics")
+        self._progress("- order_wait_attribution.csv: Processing, queue-wait & hand-off hours per order & machine")
+        self._progress("- machine_delay_contribution.csv: Machine contribution to order lead time")
+        self._progress("- quarantined_phases.csv / quarantined_orders.csv: Rows failing data-quality rules, with reason codes")
+        self._progress("- summary_statistics.json: Overall KPIs and data-quality rule counts")
 
         return summary
 
@@ -1,16 +1,26 @@
 import schedule
 import time
 import shutil
-from flask import Flask, jsonify, send_file, request
+from flask import Flask, Response, jsonify, send_file, request, stream_with_context
 import os
 from datetime import datetime
 import logging
-from manufacturing_analytics import ManufacturingAnalytics
+from plants import build_plants
+from health import MongoPingCache, StartupTimer
+from output_encoding import compress_outputs, is_hidden_output, negotiate_encoding, accepts_encoding, available_encodings, variant_path
 import threading
+import queue
 import zipfile
+import gzip
+import mimetypes
 import json
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
+# The analytics stack (pandas, numpy, pymongo) is imported lazily: by the
+# background initialization thread, or by the first request that needs it
+startup_timer = StartupTimer()
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -28,15 +38,29 @@ PROCESS_DATABASE_NAME = os.environ.get('PROCESS_DATABASE_NAME', DATABASE_NAME)
 OUTPUT_DIR = os.environ.get('OUTPUT_DIR', './analytics_output')
 GRAFANA_CSV_DIR = os.environ.get('GRAFANA_CSV_DIR', '/var/lib/grafana/csv')
 SCHEDULE_INTERVAL = int(os.environ.get('SCHEDULE_INTERVAL_MINUTES', 60))
+# Runs stop cleanly (publishing partial results) once over budget; 0 disables
+RUN_TIME_BUDGET = float(os.environ.get('RUN_TIME_BUDGET_MINUTES', SCHEDULE_INTERVAL))
+LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL_SECONDS', 5))
+LIVE_HEARTBEAT_INTERVAL = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', 15))
+# JSON list of plant definitions (or a path to one); unset = single plant
+PLANTS_CONFIG = os.environ.get('PLANTS_CONFIG')
+USE_MOCK_MONGO = os.environ.get('USE_MOCK_MONGO', 'false').lower() == 'true'
+HEALTH_CACHE_TTL = float(os.environ.get('HEALTH_CACHE_TTL_SECONDS', 15))
+# How often startup readiness is checked in the background until first ready
+READINESS_CHECK_INTERVAL = 0.5
+# IANA timezone report dates are written in (MongoDB stores them in UTC)
+ANALYTICS_TIMEZONE = os.environ.get('ANALYTICS_TIMEZONE', 'UTC')
+
+# Plants served by this instance; /analytics/... targets the first one
+plants = build_plants(
+    PLANTS_CONFIG, MONGO_URI, DATABASE_NAME, PROCESS_DATABASE_NAME, OUTPUT_DIR, GRAFANA_CSV_DIR,
+    use_mock_mongo=USE_MOCK_MONGO, timezone=ANALYTICS_TIMEZONE
+)
+DEFAULT_PLANT_ID = next(iter(plants))
+PLANT_CONCURRENCY = int(os.environ.get('PLANT_CONCURRENCY', min(len(plants), 4)))
 
-# Global analytics instance
-analytics = None
-last_run_status = {
-    'status': 'pending',
-    'timestamp': None,
-    'files_generated': 0,
-    'error': None
-}
+# MongoDB ping results shared by all health probes
+mongo_ping_cache = MongoPingCache(ttl=HEALTH_CACHE_TTL)
 
 def handle_errors(f):
     """Decorator to handle API errors gracefully"""
@@ -53,29 +77,45 @@ def handle_errors(f):
             }), 500
     return decorated_function
 
-def initialize_analytics():
-    """Initialize analytics service with error handling.
+def plant_route(rule, **options):
+    """Register a view at ``rule`` for the default plant and at
+    ``/plants/<plant_id>`` + ``rule`` for any plant. The view receives the
+    resolved ``Plant`` as its first argument."""
+    def decorator(f):
+        @wraps(f)
+        def view(plant_id=None, **kwargs):
+            plant = plants.get(plant_id or DEFAULT_PLANT_ID)
+            if plant is None:
+                return jsonify({'error': f'Unknown plant: {plant_id}'}), 404
+            return f(plant, **kwargs)
+        app.add_url_rule(rule, f.__name__, view, **options)
+        app.add_url_rule(f'/plants/<plant_id>{rule}', f'plant_{f.__name__}', view, **options)
+        return view
+    return decorator
+
+def initialize_analytics(plant):
+    """Initialize a plant's analytics service with error handling.
     If the ``USE_MOCK_MONGO`` environment variable is set to ``true`` the
     service will use an in-memory MongoDB instance.
     """
-    global analytics
     try:
-        analytics = ManufacturingAnalytics(MONGO_URI, DATABASE_NAME, PROCESS_DATABASE_NAME)
-        logger.info("Analytics service initialized successfully")
+        plant.initialize()
+        logger.info(f"Analytics service initialized successfully for plant {plant.plant_id}")
         return True
     except Exception as e:
-        logger.error(f"Failed to initialize analytics service: {str(e)}")
+        logger.error(f"Failed to initialize analytics service for plant {plant.plant_id}: {str(e)}")
         return False
 
-def copy_files_to_grafana():
-    """Copy CSV files to Grafana data directory"""
+def copy_files_to_grafana(plant):
+    """Copy a plant's CSV files to its Grafana data directory"""
     try:
         if os.path.exists(GRAFANA_CSV_DIR):
+            os.makedirs(plant.grafana_csv_dir, exist_ok=True)
             # Copy all CSV files to Grafana directory
-            for filename in os.listdir(OUTPUT_DIR):
+            for filename in os.listdir(plant.output_dir):
                 if filename.endswith('.csv'):
-                    src = os.path.join(OUTPUT_DIR, filename)
-                    dst = os.path.join(GRAFANA_CSV_DIR, filename)
+                    src = os.path.join(plant.output_dir, filename)
+                    dst = os.path.join(plant.grafana_csv_dir, filename)
                     shutil.copy2(src, dst)
                     logger.info(f"Copied {filename} to Grafana directory")
         else:
@@ -83,12 +123,34 @@ def copy_files_to_grafana():
     except Exception as e:
         logger.error(f"Error copying files to Grafana: {str(e)}")
 
-def run_analytics():
-    """Run the analytics process and generate CSV files"""
-    global last_run_status
+def run_analytics(plant=None, time_budget_minutes=None, resume=True):
+    """Run the analytics process for a plant and generate CSV files.
+
+    The run resumes from the last checkpointed stage of a failed or stopped
+    run unless ``resume`` is false (checkpoints older than one schedule
+    interval are discarded), and stops when cancelled or after
+    ``time_budget_minutes`` (default ``RUN_TIME_BUDGET_MINUTES``).
+
+    Only one run per plant at a time: returns None without running if
+    another run of the plant is in progress.
+    """
+    plant = plant or plants[DEFAULT_PLANT_ID]
+    if not plant.run_lock.acquire(blocking=False):
+        logger.warning(f"Analytics run for plant {plant.plant_id} already in progress, skipping")
+        return None
+    try:
+        return _run_analytics_locked(plant, time_budget_minutes, resume)
+    finally:
+        plant.run_lock.release()
+
+def _run_analytics_locked(plant, time_budget_minutes, resume):
+    last_run_status = plant.last_run_status
+
+    if time_budget_minutes is None:
+        time_budget_minutes = RUN_TIME_BUDGET
     
-    if not analytics:
-        if not initialize_analytics():
+    if not plant.analytics:
+        if not initialize_analytics(plant):
             last_run_status.update({
                 'status': 'error',
                 'timestamp': datetime.now().isoformat(),
@@ -97,7 +159,8 @@ def run_analytics():
             return False
     
     try:
-        logger.info("Starting analytics generation...")
+        logger.info(f"Starting analytics generation for plant {plant.plant_id}...")
+        plant.cancel_requested.clear()
         last_run_status.update({
             'status': 'running',
             'timestamp': datetime.now().isoformat(),
@@ -105,30 +168,49 @@ def run_analytics():
         })
         
         # Create output directory if it doesn't exist
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        os.makedirs(plant.output_dir, exist_ok=True)
         
         # Generate analytics
-        summary = analytics.export_to_csv(OUTPUT_DIR)
+        summary = plant.analytics.export_to_csv(
+            plant.output_dir,
+            time_budget=time_budget_minutes * 60 if time_budget_minutes > 0 else None,
+            cancel_event=plant.cancel_requested,
+            resume=resume,
+            checkpoint_max_age=SCHEDULE_INTERVAL * 60
+        )
         
         # Copy files to Grafana directory
-        copy_files_to_grafana()
+        copy_files_to_grafana(plant)
+
+        # Precompress outputs for /analytics/download
+        compress_outputs(plant.output_dir)
         
         # Count generated files
-        files_generated = len([f for f in os.listdir(OUTPUT_DIR) if f.endswith('.csv')])
+        files_generated = len([f for f in os.listdir(plant.output_dir) if f.endswith('.csv')])
         
+        if not summary.get('partial'):
+            status = 'success'
+        elif summary['stopped_reason'] == 'cancelled':
+            status = 'cancelled'
+        else:
+            status = 'partial'
+
         last_run_status.update({
-            'status': 'success',
+            'status': status,
             'timestamp': datetime.now().isoformat(),
             'files_generated': files_generated,
             'error': None,
             'summary': summary
         })
         
-        logger.info(f"Analytics completed successfully: {summary}")
+        if status == 'success':
+            logger.info(f"Analytics completed successfully for plant {plant.plant_id}: {summary}")
+        else:
+            logger.warning(f"Analytics stopped early for plant {plant.plant_id} ({summary['stopped_reason']}), pending stages: {summary['pending_stages']}")
         return True
         
     except Exception as e:
-        error_msg = f"Error during analytics generation: {str(e)}"
+        error_msg = f"Error during analytics generation for plant {plant.plant_id}: {str(e)}"
         logger.error(error_msg)
         last_run_status.update({
             'status': 'error',
@@ -137,40 +219,192 @@ def run_analytics():
         })
         return False
 
+def run_all_plants(time_budget_minutes=None, resume=True):
+    """Run analytics for every plant concurrently (``PLANT_CONCURRENCY`` at a time).
+
+    Returns plant id -> success for the plants that ran; plants with a run in
+    progress are skipped.
+    """
+    with ThreadPoolExecutor(max_workers=max(PLANT_CONCURRENCY, 1), thread_name_prefix='plant') as executor:
+        futures = {
+            plant_id: executor.submit(run_analytics, plant, time_budget_minutes, resume)
+            for plant_id, plant in plants.items()
+            if plant.last_run_status['status'] != 'running'
+        }
+        results = {plant_id: future.result() for plant_id, future in futures.items()}
+    # None: the plant was already running (skipped)
+    return {plant_id: result for plant_id, result in results.items() if result is not None}
+
+# Percentiles derived per cube cell from its lead-time/delay histograms
+CUBE_PERCENTILES = (50, 90, 95)
+
+def cube_cell(row):
+    """Turn an order_cube.csv row into a JSON-ready cell with derived KPIs"""
+    cell = {k: (None if isinstance(v, float) and v != v else v) for k, v in row.items()}
+    cell['on_time_delivery_rate'] = (
+        cell['on_time_orders'] / cell['on_time_known'] * 100 if cell['on_time_known'] else None
+    )
+    if cell['lead_time_count']:
+        mean = cell['lead_time_sum'] / cell['lead_time_count']
+        cell['avg_lead_time'] = mean
+        cell['lead_time_std'] = max(cell['lead_time_sq_sum'] / cell['lead_time_count'] - mean ** 2, 0) ** 0.5
+    else:
+        cell['avg_lead_time'] = None
+        cell['lead_time_std'] = None
+    cell['avg_delay'] = cell['delay_sum'] / cell['delay_count'] if cell['delay_count'] else None
+
+    # Percentiles from the fixed-bin histograms; the raw bins are returned as lists
+    from manufacturing_analytics import (
+        DELAY_BIN_EDGES, DELAY_BINS, LEAD_TIME_BIN_EDGES, LEAD_TIME_BINS, histogram_quantile
+    )
+    for measure, bins, edges in (
+        ('lead_time', LEAD_TIME_BINS, LEAD_TIME_BIN_EDGES),
+        ('delay', DELAY_BINS, DELAY_BIN_EDGES),
+    ):
+        counts = [int(cell.pop(column, 0)) for column in bins]
+        cell[f'{measure}_histogram'] = {'bin_edges': edges, 'counts': counts}
+        for percentile in CUBE_PERCENTILES:
+            cell[f'{measure}_p{percentile}'] = histogram_quantile(
+                counts, edges, percentile / 100, cell[f'{measure}_min'], cell[f'{measure}_max']
+            )
+    return cell
+
+def load_cube(plant, cube_path):
+    """Index a plant's order_cube.csv by cell key, reloading only when the file changed.
+
+    ``cells`` maps a (family, article, priority, period) key to its cell;
+    ``children`` maps (dimension, key with that dimension rolled up) to the
+    cells that break it down, so both lookups are independent of order count.
+    """
+    import pandas as pd
+    from manufacturing_analytics import CUBE_DIMENSIONS, CUBE_ALL
+
+    cube_cache = plant.cube_cache
+    mtime = os.path.getmtime(cube_path)
+    with plant.cube_lock:
+        if cube_cache['mtime'] != mtime:
+            cube = pd.read_csv(
+                cube_path,
+                dtype={dimension: str for dimension in CUBE_DIMENSIONS},
+                keep_default_na=False,
+                na_values={measure: [''] for measure in ('lead_time_min', 'lead_time_max', 'delay_min', 'delay_max')}
+            )
+            cells = {}
+            children = {}
+            for row in cube.to_dict('records'):
+                cell = cube_cell(row)
+                key = tuple(cell[dimension] for dimension in CUBE_DIMENSIONS)
+                cells[key] = cell
+                for i, dimension in enumerate(CUBE_DIMENSIONS):
+                    if key[i] != CUBE_ALL:
+                        parent = key[:i] + (CUBE_ALL,) + key[i + 1:]
+                        children.setdefault((dimension, parent), []).append(cell)
+            cube_cache.update({'mtime': mtime, 'cells': cells, 'children': children})
+        return cube_cache['cells'], cube_cache['children']
+
+def get_live_monitor(plant):
+    """Start a plant's live KPI monitor on first use and return it"""
+    from live_kpis import LiveKPIMonitor
+
+    with plant.live_monitor_lock:
+        if plant.live_monitor is None or not plant.live_monitor.running:
+            if not plant.analytics and not initialize_analytics(plant):
+                return None
+            if plant.live_monitor is not None:
+                # A watch thread died: stop what is left and start afresh
+                plant.live_monitor.stop()
+            plant.live_monitor = LiveKPIMonitor(plant.analytics, poll_interval=LIVE_POLL_INTERVAL)
+            plant.live_monitor.start()
+        return plant.live_monitor
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def plant_health(plant):
+    """Per-plant health from cached state only (no MongoDB round trip)"""
+    plant_status = {
+        'analytics_service': 'connected' if plant.analytics else 'disconnected',
+        'last_run_status': plant.last_run_status['status']
+    }
+    if plant.analytics:
+        ping = mongo_ping_cache.status(plant.analytics.client)
+        plant_status['mongodb'] = ping['status']
+        plant_status['mongodb_ping_ms'] = ping['latency_ms']
+        plant_status['mongodb_checked_seconds_ago'] = ping['age_seconds']
+    else:
+        plant_status['mongodb'] = 'disconnected'
+    return plant_status
+
+def check_readiness():
+    """Every plant initialized and its MongoDB answering pings; records the
+    time to ready the first time it holds. Returns (ready, plant statuses)."""
+    plant_statuses = {plant_id: plant_health(plant) for plant_id, plant in plants.items()}
+    ready = all(p['mongodb'] == 'connected' for p in plant_statuses.values())
+    if ready:
+        startup_timer.mark_ready()
+    return ready, plant_statuses
+
+def watch_readiness():
+    """Check readiness in the background until it holds, so ``startup_seconds``
+    is recorded even if nothing probes ``/health/ready``"""
+    while not check_readiness()[0]:
+        time.sleep(READINESS_CHECK_INTERVAL)
+
 @app.route('/health')
 @handle_errors
 def health():
-    """Health check endpoint with detailed status"""
+    """Health check endpoint with detailed status.
+
+    Served from cached state: the MongoDB status is the last background ping
+    (refreshed every ``HEALTH_CACHE_TTL_SECONDS``) and ``files_count`` comes
+    from the last run, so probes never touch MongoDB or the output directory.
+    """
+    default_plant = plants[DEFAULT_PLANT_ID]
     health_status = {
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'service': 'manufacturing-analytics',
         'version': '1.0.0',
-        'analytics_service': 'connected' if analytics else 'disconnected',
-        'last_run': last_run_status,
-        'output_directory': OUTPUT_DIR,
-        'files_count': len([f for f in os.listdir(OUTPUT_DIR) if os.path.isfile(os.path.join(OUTPUT_DIR, f))]) if os.path.exists(OUTPUT_DIR) else 0
+        'analytics_service': 'connected' if default_plant.analytics else 'disconnected',
+        'last_run': default_plant.last_run_status,
+        'output_directory': default_plant.output_dir,
+        'files_count': default_plant.last_run_status['files_generated'],
+        'startup_seconds': startup_timer.ready_after,
+        'plants': {plant_id: plant_health(plant) for plant_id, plant in plants.items()}
     }
-    
-    # Check if we can connect to MongoDB
-    try:
-        if analytics:
-            # Test connection by counting documents
-            analytics.orders_collection.count_documents({}, limit=1)
-            health_status['mongodb'] = 'connected'
-        else:
-            health_status['mongodb'] = 'disconnected'
-    except Exception as e:
-        health_status['mongodb'] = f'error: {str(e)}'
+    health_status['mongodb'] = health_status['plants'][DEFAULT_PLANT_ID]['mongodb']
+    if any(p['mongodb'].startswith('error') for p in health_status['plants'].values()):
         health_status['status'] = 'unhealthy'
     
     status_code = 200 if health_status['status'] == 'healthy' else 503
     return jsonify(health_status), status_code
 
-@app.route('/analytics/run', methods=['POST'])
+@app.route('/health/live')
+def health_live():
+    """Liveness probe: the process is up and serving requests"""
+    return jsonify({
+        'status': 'alive',
+        'uptime_seconds': round(time.monotonic() - startup_timer.started_at, 1),
+        'startup_seconds': startup_timer.ready_after
+    })
+
+@app.route('/health/ready')
+@handle_errors
+def health_ready():
+    """Readiness probe: every plant is initialized and its MongoDB answers pings"""
+    ready, plant_statuses = check_readiness()
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'startup_seconds': startup_timer.ready_after,
+        'plants': {plant_id: p['mongodb'] for plant_id, p in plant_statuses.items()}
+    }), 200 if ready else 503
+
+@plant_route('/analytics/run', methods=['POST'])
 @handle_errors
-def trigger_analytics():
+def trigger_analytics(plant):
     """Manually trigger analytics generation"""
+    last_run_status = plant.last_run_status
     force = request.args.get('force', 'false').lower() == 'true'
     
     # Check if already running
@@ -181,11 +415,25 @@ def trigger_analytics():
             'timestamp': datetime.now().isoformat()
         }), 409
     
-    success = run_analytics()
+    time_budget = request.args.get('time_budget_minutes', type=float)
+    resume = request.args.get('resume', 'true').lower() == 'true'
+
+    success = run_analytics(plant, time_budget_minutes=time_budget, resume=resume)
+    if success is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Analytics generation already in progress',
+            'timestamp': datetime.now().isoformat()
+        }), 409
     if success:
+        messages = {
+            'success': 'Analytics generated successfully',
+            'partial': 'Time budget exceeded, partial analytics published',
+            'cancelled': 'Analytics generation cancelled'
+        }
         return jsonify({
-            'status': 'success',
-            'message': 'Analytics generated successfully',
+            'status': last_run_status['status'],
+            'message': messages[last_run_status['status']],
             'timestamp': datetime.now().isoformat(),
             'last_run': last_run_status
         })
@@ -197,31 +445,51 @@ def trigger_analytics():
             'last_run': last_run_status
         }), 500
 
-@app.route('/analytics/status')
+@plant_route('/analytics/cancel', methods=['POST'])
+@handle_errors
+def cancel_analytics(plant):
+    """Cancel the running analytics generation after its current stage"""
+    if plant.last_run_status['status'] != 'running':
+        return jsonify({
+            'status': 'error',
+            'message': 'No analytics generation in progress',
+            'timestamp': datetime.now().isoformat()
+        }), 409
+
+    plant.cancel_requested.set()
+    return jsonify({
+        'status': 'cancelling',
+        'message': 'Analytics generation will stop after the current stage',
+        'timestamp': datetime.now().isoformat()
+    }), 202
+
+@plant_route('/analytics/status')
 @handle_errors
-def get_status():
+def get_status(plant):
     """Get current analytics status"""
     return jsonify({
-        'current_status': last_run_status,
+        'plant': plant.plant_id,
+        'current_status': plant.last_run_status,
         'next_scheduled_run': schedule.next_run().isoformat() if schedule.jobs else None,
         'schedule_interval_minutes': SCHEDULE_INTERVAL
     })
 
-@app.route('/analytics/files')
+@plant_route('/analytics/files')
 @handle_errors
-def list_files():
+def list_files(plant):
     """List available analytics files with metadata"""
     files = []
-    if os.path.exists(OUTPUT_DIR):
-        for filename in os.listdir(OUTPUT_DIR):
-            filepath = os.path.join(OUTPUT_DIR, filename)
-            if os.path.isfile(filepath):
+    if os.path.exists(plant.output_dir):
+        for filename in os.listdir(plant.output_dir):
+            filepath = os.path.join(plant.output_dir, filename)
+            if os.path.isfile(filepath) and not is_hidden_output(filename):
                 file_info = {
                     'name': filename,
                     'size': os.path.getsize(filepath),
                     'size_mb': round(os.path.getsize(filepath) / (1024*1024), 2),
                     'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat(),
-                    'type': 'csv' if filename.endswith('.csv') else 'json' if filename.endswith('.json') else 'other'
+                    'type': 'csv' if filename.endswith('.csv') else 'json' if filename.endswith('.json') else 'other',
+                    'encodings': available_encodings(filepath)
                 }
                 files.append(file_info)
     
@@ -231,39 +499,112 @@ def list_files():
         'total_size_mb': round(sum(f['size'] for f in files) / (1024*1024), 2)
     })
 
-@app.route('/analytics/download/<filename>')
+@plant_route('/analytics/download/<filename>')
 @handle_errors
-def download_file(filename):
-    """Download a specific analytics file"""
+def download_file(plant, filename):
+    """Download a specific analytics file.
+
+    Serves the precompressed zstd/gzip variant negotiated from
+    ``Accept-Encoding``, with ETag/Last-Modified conditional GET and Range
+    support. For CSV files, ``rows=<start>-<end>`` (0-based data rows, end
+    exclusive) and ``columns=<a,b,...>`` return just that slice.
+    """
     # Security: prevent path traversal
     filename = os.path.basename(filename)
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    filepath = os.path.join(plant.output_dir, filename)
     
-    if os.path.exists(filepath) and os.path.isfile(filepath):
-        return send_file(filepath, as_attachment=True)
-    else:
+    if not (os.path.exists(filepath) and os.path.isfile(filepath)):
         return jsonify({'error': 'File not found'}), 404
 
-@app.route('/analytics/download-all')
+    if 'rows' in request.args or 'columns' in request.args:
+        return download_csv_slice(filepath)
+
+    encoding = negotiate_encoding(filepath, request.accept_encodings)
+    if encoding:
+        response = send_file(
+            variant_path(filepath, encoding),
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            as_attachment=True,
+            download_name=filename,
+            conditional=True
+        )
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_file(filepath, as_attachment=True, conditional=True)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def download_csv_slice(filepath):
+    """Serve a row range and/or column subset of a CSV output"""
+    import pandas as pd
+
+    if not filepath.endswith('.csv'):
+        return jsonify({'error': 'Row/column selection is only supported for CSV files'}), 400
+
+    start, end = 0, None
+    if 'rows' in request.args:
+        try:
+            start_text, _, end_text = request.args['rows'].partition('-')
+            start = int(start_text or 0)
+            end = int(end_text) if end_text else None
+        except ValueError:
+            return jsonify({'error': 'rows must be <start>-<end>'}), 400
+        if start < 0 or (end is not None and end < start):
+            return jsonify({'error': 'rows must be <start>-<end> with 0 <= start <= end'}), 400
+
+    columns = None
+    if request.args.get('columns'):
+        columns = request.args['columns'].split(',')
+        header = pd.read_csv(filepath, nrows=0).columns
+        unknown = [c for c in columns if c not in header]
+        if unknown:
+            return jsonify({'error': f'Unknown columns: {unknown}'}), 400
+
+    # Values are kept as text so the slice matches the file byte-for-byte
+    data = pd.read_csv(
+        filepath,
+        dtype=str,
+        keep_default_na=False,
+        usecols=columns,
+        skiprows=range(1, start + 1),
+        nrows=end - start if end is not None else None
+    )
+    if columns:
+        data = data[columns]
+    body = data.to_csv(index=False).encode()
+
+    response = Response(mimetype='text/csv')
+    if accepts_encoding(request.accept_encodings, 'gzip') > 0:
+        body = gzip.compress(body, mtime=0)
+        response.headers['Content-Encoding'] = 'gzip'
+    response.set_data(body)
+    response.headers['Content-Disposition'] = f'attachment; filename={os.path.basename(filepath)}'
+    response.vary.add('Accept-Encoding')
+    response.add_etag()
+    response.last_modified = datetime.fromtimestamp(os.path.getmtime(filepath))
+    return response.make_conditional(request)
+
+@plant_route('/analytics/download-all')
 @handle_errors
-def download_all():
+def download_all(plant):
     """Download all analytics files as a zip"""
-    zip_path = os.path.join(OUTPUT_DIR, f'analytics_all_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip')
+    zip_path = os.path.join(plant.output_dir, f'analytics_all_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip')
     
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for filename in os.listdir(OUTPUT_DIR):
-            if filename != os.path.basename(zip_path):  # Don't include the zip file itself
-                filepath = os.path.join(OUTPUT_DIR, filename)
+        for filename in os.listdir(plant.output_dir):
+            # Don't include the zip file itself, compressed variants or temp files
+            if filename != os.path.basename(zip_path) and not is_hidden_output(filename):
+                filepath = os.path.join(plant.output_dir, filename)
                 if os.path.isfile(filepath):
                     zipf.write(filepath, filename)
     
     return send_file(zip_path, as_attachment=True)
 
-@app.route('/analytics/summary')
+@plant_route('/analytics/summary')
 @handle_errors
-def get_summary():
+def get_summary(plant):
     """Get the latest summary statistics"""
-    summary_path = os.path.join(OUTPUT_DIR, 'summary_statistics.json')
+    summary_path = os.path.join(plant.output_dir, 'summary_statistics.json')
     if os.path.exists(summary_path):
         try:
             with open(summary_path, 'r') as f:
@@ -271,7 +612,7 @@ def get_summary():
             
             # Add metadata
             summary['file_generated'] = datetime.fromtimestamp(os.path.getmtime(summary_path)).isoformat()
-            summary['last_analytics_run'] = last_run_status['timestamp']
+            summary['last_analytics_run'] = plant.last_run_status['timestamp']
             
             return jsonify(summary)
         except json.JSONDecodeError as e:
@@ -279,17 +620,91 @@ def get_summary():
     else:
         return jsonify({'error': 'Summary not found. Run analytics first.'}), 404
 
-@app.route('/analytics/config')
+@plant_route('/analytics/cube')
+@handle_errors
+def get_cube_slice(plant):
+    """Get order KPIs for a cube slice.
+
+    Filter with any of ``product_family``, ``article_code``, ``priority`` and
+    ``period`` (``YYYY-MM``); omitted dimensions are rolled up. ``group_by``
+    names one omitted dimension to break the slice down by.
+    """
+    from manufacturing_analytics import CUBE_DIMENSIONS, CUBE_ALL
+
+    cube_path = os.path.join(plant.output_dir, 'order_cube.csv')
+    if not os.path.exists(cube_path):
+        return jsonify({'error': 'Order cube not found. Run analytics first.'}), 404
+
+    cells, children = load_cube(plant, cube_path)
+    key = tuple(request.args.get(dimension, CUBE_ALL) for dimension in CUBE_DIMENSIONS)
+
+    group_by = request.args.get('group_by')
+    if group_by:
+        if group_by not in CUBE_DIMENSIONS:
+            return jsonify({'error': f'Unknown dimension: {group_by}'}), 400
+        if key[CUBE_DIMENSIONS.index(group_by)] != CUBE_ALL:
+            return jsonify({'error': f'Cannot group by filtered dimension: {group_by}'}), 400
+        return jsonify({
+            'slice': dict(zip(CUBE_DIMENSIONS, key)),
+            'group_by': group_by,
+            'groups': children.get((group_by, key), [])
+        })
+
+    cell = cells.get(key)
+    if cell is None:
+        cell = dict(zip(CUBE_DIMENSIONS, key), orders=0)
+    return jsonify(cell)
+
+@plant_route('/analytics/live')
 @handle_errors
-def get_config():
+def live_kpis(plant):
+    """Stream live KPI deltas as Server-Sent Events.
+
+    The first ``snapshot`` event carries all machine/queue rows and global
+    KPIs; each following ``delta`` event carries only the order, machine and
+    queue rows touched by a change in MongoDB.
+    """
+    monitor = get_live_monitor(plant)
+    if monitor is None:
+        return jsonify({'error': 'Analytics service not initialized'}), 503
+
+    subscriber = monitor.subscribe()
+
+    def stream():
+        try:
+            yield sse_event('snapshot', monitor.snapshot())
+            while True:
+                try:
+                    delta = subscriber.get(timeout=LIVE_HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    if not monitor.running:
+                        # End the stream; the client reconnects to a restarted monitor
+                        return
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                yield sse_event('delta', delta)
+        finally:
+            monitor.unsubscribe(subscriber)
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@plant_route('/analytics/config')
+@handle_errors
+def get_config(plant):
     """Get current service configuration"""
+    plant_info = plant.info()
     return jsonify({
-        'mongo_uri': MONGO_URI.replace(MONGO_URI.split('@')[0].split('//')[1], '***') if '@' in MONGO_URI else MONGO_URI,
-        'database_name': DATABASE_NAME,
-        'process_database_name': PROCESS_DATABASE_NAME,
-        'output_directory': OUTPUT_DIR,
-        'grafana_csv_directory': GRAFANA_CSV_DIR,
+        'plant': plant_info.pop('id'),
+        **plant_info,
+        'plant_concurrency': PLANT_CONCURRENCY,
+        'use_mock_mongo': USE_MOCK_MONGO,
         'schedule_interval_minutes': SCHEDULE_INTERVAL,
+        'run_time_budget_minutes': RUN_TIME_BUDGET,
         'service_info': {
             'name': 'manufacturing-analytics',
             'version': '1.0.0',
@@ -297,16 +712,59 @@ def get_config():
         }
     })
 
+@app.route('/plants')
+@handle_errors
+def list_plants():
+    """List the configured plants with their latest run status"""
+    return jsonify({
+        'default_plant': DEFAULT_PLANT_ID,
+        'plants': [
+            dict(plant.info(), last_run=plant.last_run_status)
+            for plant in plants.values()
+        ]
+    })
+
+@app.route('/plants/run', methods=['POST'])
+@handle_errors
+def trigger_all_plants():
+    """Run analytics for every plant concurrently"""
+    time_budget = request.args.get('time_budget_minutes', type=float)
+    resume = request.args.get('resume', 'true').lower() == 'true'
+
+    results = run_all_plants(time_budget_minutes=time_budget, resume=resume)
+    if not results:
+        return jsonify({
+            'status': 'error',
+            'message': 'Analytics generation already in progress for every plant',
+            'timestamp': datetime.now().isoformat(),
+            'skipped': list(plants)
+        }), 409
+    return jsonify({
+        'status': 'success' if results and all(results.values()) else 'error',
+        'timestamp': datetime.now().isoformat(),
+        'plants': {
+            plant_id: plants[plant_id].last_run_status['status'] for plant_id in results
+        },
+        'skipped': [plant_id for plant_id in plants if plant_id not in results]
+    }), 200 if all(results.values()) else 500
+
 def run_scheduler():
-    """Run the scheduled analytics generation"""
+    """Initialize the plants, then run the scheduled analytics generation"""
+    threading.Thread(target=watch_readiness, name='readiness', daemon=True).start()
+
+    # Initialize analytics service (imports the analytics stack off the request path)
+    for plant in plants.values():
+        if not initialize_analytics(plant):
+            logger.error(f"Failed to initialize analytics service for plant {plant.plant_id}. Some endpoints may not work.")
+
     logger.info(f"Starting scheduler with {SCHEDULE_INTERVAL} minute intervals")
     
-    # Run once on startup
-    logger.info("Running initial analytics generation...")
-    run_analytics()
-    
     # Schedule regular runs
-    schedule.every(SCHEDULE_INTERVAL).minutes.do(run_analytics)
+    schedule.every(SCHEDULE_INTERVAL).minutes.do(run_all_plants)
+
+    # Run once on startup, in the background so the API answers meanwhile
+    logger.info("Running initial analytics generation...")
+    threading.Thread(target=run_all_plants, name='initial-run', daemon=True).start()
     
     while True:
         schedule.run_pending()
@@ -316,14 +774,10 @@ if __name__ == '__main__':
     # Record start time for uptime calculation
     start_time = time.time()
     
-    # Initialize analytics service
-    if not initialize_analytics():
-        logger.error("Failed to initialize analytics service. Some endpoints may not work.")
-    
     # Start scheduler in a separate thread
     scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
     scheduler_thread.start()
     
     # Start Flask API
     logger.info("Starting Flask API server...")
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,122 @@
+import gzip
+import logging
+import os
+import shutil
+from typing import List, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd variants are optional; gzip is always produced
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+# Content-Encoding -> file suffix of the precompressed variant, in order of
+# preference when the client accepts several with the same quality
+COMPRESSED_VARIANTS = {
+    'zstd': '.zst',
+    'gzip': '.gz',
+}
+COMPRESSIBLE_SUFFIXES = ('.csv', '.json')
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 10
+
+
+def is_compressed_variant(filename: str) -> bool:
+    """True for the .gz/.zst siblings written next to each output file"""
+    return filename.endswith(tuple(COMPRESSED_VARIANTS.values()))
+
+
+def is_hidden_output(filename: str) -> bool:
+    """True for files not published on their own: compressed variants and
+    the .tmp files outputs are written to before being moved into place"""
+    return is_compressed_variant(filename) or filename.endswith('.tmp')
+
+
+def variant_path(filepath: str, encoding: str) -> str:
+    return filepath + COMPRESSED_VARIANTS[encoding]
+
+
+def available_encodings(filepath: str) -> List[str]:
+    """Encodings whose variant exists and is not older than the original"""
+    mtime = os.path.getmtime(filepath)
+    encodings = []
+    for encoding in COMPRESSED_VARIANTS:
+        path = variant_path(filepath, encoding)
+        if os.path.exists(path) and os.path.getmtime(path) >= mtime:
+            encodings.append(encoding)
+    return encodings
+
+
+def accepts_encoding(accept_encodings, encoding: str) -> float:
+    """Quality of ``encoding`` in a werkzeug ``Accept-Encoding``, or 0 when the
+    client does not prefer it over the uncompressed response.
+
+    An explicitly listed ``identity`` must be beaten (strictly higher quality),
+    so ``identity;q=1, gzip;q=0.1`` keeps the response uncompressed.
+    """
+    quality = accept_encodings.quality(encoding)
+    if any(value.lower() == 'identity' for value, _ in accept_encodings):
+        if quality <= accept_encodings.quality('identity'):
+            return 0
+    return quality
+
+
+def negotiate_encoding(filepath: str, accept_encodings) -> Optional[str]:
+    """Pick the best precompressed variant for a werkzeug ``Accept-Encoding``.
+
+    Returns None when the original (identity) file should be served.
+    """
+    best, best_quality = None, 0
+    for encoding in available_encodings(filepath):
+        quality = accepts_encoding(accept_encodings, encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _write_atomically(path: str, data_writer):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        data_writer(f)
+    os.replace(tmp_path, path)
+
+
+def compress_file(filepath: str):
+    """Write the gzip (and, if available, zstd) variants of one file"""
+    def write_gzip(out):
+        # mtime=0 keeps the gzip bytes (and so the ETag) stable across runs
+        with open(filepath, 'rb') as src, gzip.GzipFile(
+            filename='', mode='wb', fileobj=out, compresslevel=GZIP_LEVEL, mtime=0
+        ) as gz:
+            shutil.copyfileobj(src, gz)
+
+    _write_atomically(variant_path(filepath, 'gzip'), write_gzip)
+
+    if zstandard is not None:
+        def write_zstd(out):
+            with open(filepath, 'rb') as src:
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, out)
+
+        _write_atomically(variant_path(filepath, 'zstd'), write_zstd)
+
+
+def compress_outputs(output_dir: str) -> int:
+    """Refresh the compressed variants of every CSV/JSON output in ``output_dir``.
+
+    Files whose variants are already up to date are skipped. Returns the
+    number of files compressed.
+    """
+    compressed = 0
+    for filename in os.listdir(output_dir):
+        filepath = os.path.join(output_dir, filename)
+        if not filename.endswith(COMPRESSIBLE_SUFFIXES) or not os.path.isfile(filepath):
+            continue
+        expected = ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+        if all(encoding in available_encodings(filepath) for encoding in expected):
+            continue
+        compress_file(filepath)
+        compressed += 1
+    logger.info(f"Compressed {compressed} output files in {output_dir}")
+    return compressed
@@ -0,0 +1,202 @@
+import json
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+# pymongo and the pandas-based analytics stack are imported on first use so the
+# API can start answering before they are loaded
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+
+    from manufacturing_analytics import ManufacturingAnalytics
+
+
+PLANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# One pooled MongoClient per URI, shared by every plant on that cluster
+_shared_clients: Dict[str, "MongoClient"] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(mongo_uri: str, use_mock: bool = False) -> "MongoClient":
+    """Return the process-wide MongoClient for `mongo_uri`, creating it once.
+
+    With `use_mock` the client is an in-memory mongomock instance instead.
+    """
+    with _shared_clients_lock:
+        client = _shared_clients.get(mongo_uri)
+        if client is None:
+            if use_mock:
+                import mongomock
+
+                client = mongomock.MongoClient(mongo_uri)
+            else:
+                from pymongo import MongoClient
+
+                client = MongoClient(mongo_uri)
+            _shared_clients[mongo_uri] = client
+        return client
+
+
+def mask_uri(mongo_uri: str) -> str:
+    """Hide the credentials of a MongoDB URI."""
+    if "@" not in mongo_uri:
+        return mongo_uri
+    return mongo_uri.replace(mongo_uri.split("@")[0].split("//")[1], "***")
+
+
+class Plant:
+    """
+    One plant's order/process database pair and the per-plant service state:
+    analytics instance, output directory, run status, cancel flag, cube cache
+    and live KPI monitor.
+    """
+
+    def __init__(
+        self,
+        plant_id: str,
+        mongo_uri: str,
+        orders_db: str,
+        process_db: Optional[str],
+        output_dir: str,
+        grafana_csv_dir: str,
+        name: Optional[str] = None,
+        use_mock_mongo: bool = False,
+        timezone: str = "UTC",
+    ):
+        self.plant_id = plant_id
+        self.name = name or plant_id
+        self.mongo_uri = mongo_uri
+        self.orders_db = orders_db
+        self.process_db = process_db or orders_db
+        self.output_dir = output_dir
+        self.grafana_csv_dir = grafana_csv_dir
+        self.use_mock_mongo = use_mock_mongo
+        self.timezone = timezone
+
+        self.analytics: Optional["ManufacturingAnalytics"] = None
+        self.last_run_status: Dict[str, Any] = {
+            "status": "pending",
+            "timestamp": None,
+            "files_generated": 0,
+            "error": None,
+        }
+        # Set by /analytics/cancel; checked by the running analytics between stages
+        self.cancel_requested = threading.Event()
+        # Held for the whole run: runs of one plant share its output and checkpoint
+        self.run_lock = threading.Lock()
+
+        # In-memory index of order_cube.csv, reloaded when the file changes
+        self.cube_cache: Dict[str, Any] = {"mtime": None, "cells": {}, "children": {}}
+        self.cube_lock = threading.Lock()
+
+        # Live KPI monitor, started on the first /analytics/live subscriber
+        self.live_monitor = None
+        self.live_monitor_lock = threading.Lock()
+
+    def initialize(self) -> "ManufacturingAnalytics":
+        """Create the analytics instance on the shared client for this URI."""
+        from manufacturing_analytics import ManufacturingAnalytics
+
+        if self.analytics is None:
+            self.analytics = ManufacturingAnalytics(
+                self.mongo_uri,
+                self.orders_db,
+                self.process_db,
+                client=get_shared_client(self.mongo_uri, self.use_mock_mongo),
+                timezone=self.timezone,
+                label=self.plant_id,
+            )
+        return self.analytics
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "id": self.plant_id,
+            "name": self.name,
+            "mongo_uri": mask_uri(self.mongo_uri),
+            "database_name": self.orders_db,
+            "process_database_name": self.process_db,
+            "output_directory": self.output_dir,
+            "grafana_csv_directory": self.grafana_csv_dir,
+            "timezone": self.timezone,
+        }
+
+
+def load_plant_configs(config: str) -> List[Dict[str, Any]]:
+    """
+    Parse PLANTS_CONFIG: a path to a JSON file, or the JSON itself, holding a
+    list of plant definitions:
+        {"id": "...", "database_name": "...", "name"?, "mongo_uri"?,
+         "process_database_name"?, "output_dir"?, "timezone"?}
+    """
+    if os.path.exists(config):
+        with open(config) as f:
+            definitions = json.load(f)
+    else:
+        definitions = json.loads(config)
+
+    if not isinstance(definitions, list) or not definitions:
+        raise ValueError("PLANTS_CONFIG must be a non-empty list of plant definitions")
+
+    seen = set()
+    for definition in definitions:
+        plant_id = definition.get("id")
+        if not plant_id or not PLANT_ID_PATTERN.match(plant_id):
+            raise ValueError(f"Invalid plant id: {plant_id!r}")
+        if plant_id in seen:
+            raise ValueError(f"Duplicate plant id: {plant_id}")
+        if not definition.get("database_name"):
+            raise ValueError(f"Plant {plant_id} has no database_name")
+        seen.add(plant_id)
+    return definitions
+
+
+def build_plants(
+    config: Optional[str],
+    mongo_uri: str,
+    database_name: str,
+    process_database_name: Optional[str],
+    output_dir: str,
+    grafana_csv_dir: str,
+    use_mock_mongo: bool = False,
+    timezone: str = "UTC",
+) -> Dict[str, Plant]:
+    """
+    Build the plants served by this instance, in configuration order.
+
+    Without `config` there is a single "default" plant using the top-level
+    settings unchanged. With it, each plant falls back to the top-level Mongo
+    URI and writes to `<output_dir>/<id>` and `<grafana_csv_dir>/<id>`.
+    With `use_mock_mongo` every plant runs on in-memory mongomock databases.
+    `timezone` is the reporting timezone of plants that do not set their own.
+    """
+    if not config:
+        return {
+            "default": Plant(
+                "default",
+                mongo_uri,
+                database_name,
+                process_database_name,
+                output_dir,
+                grafana_csv_dir,
+                use_mock_mongo=use_mock_mongo,
+                timezone=timezone,
+            )
+        }
+
+    plants: Dict[str, Plant] = {}
+    for definition in load_plant_configs(config):
+        plant_id = definition["id"]
+        plants[plant_id] = Plant(
+            plant_id,
+            definition.get("mongo_uri", mongo_uri),
+            definition["database_name"],
+            definition.get("process_database_name"),
+            definition.get("output_dir", os.path.join(output_dir, plant_id)),
+            os.path.join(grafana_csv_dir, plant_id),
+            name=definition.get("name"),
+            use_mock_mongo=use_mock_mongo,
+            timezone=definition.get("timezone", timezone),
+        )
+    return plants